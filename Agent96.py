@@ -1,18 +1,26 @@
 import socket
 import pandas as pd
 from random import choice
-from time import sleep
+from threading import Event, Thread
+from time import sleep, time as clock
 from agents.grave import GRaveMctsAgent
 from agents.bridget import BridgetMctsAgent
-from game import GameMeta
+from game import GameState, GameMeta
+from parallel import RootParallelAgent
+from time_manager import TimeManager
 
 class Agent():
     HOST = "127.0.0.1"
     PORT = 1234
 
-    def run(self, verbose=False, save_file=None, time_per_move=4):
+    def run(self, verbose=False, save_file=None, time_per_move=4, workers=1, ponder=True,
+            game_time=None):
         """A finite-state machine that cycles through waiting for input
-        and sending moves.
+        and sending moves. With more than one worker the search runs
+        root-parallel over that many processes. With ponder the single
+        process agent keeps searching while waiting for the opponent.
+        game_time is our whole clock in seconds, by default time_per_move
+        for every move we could have to play.
         """
 
         self._board_size = 0
@@ -20,10 +28,19 @@ class Agent():
         self._colour = ""
         self._turn_count = 0
         self._choices = []
-        self.agent = BridgetMctsAgent()
+        # the agent is created once START gives the board size
+        self.agent = None
+        self.workers = workers
+        self.ponder = ponder and workers <= 1
+        self._ponder_thread = None
+        self._pondered = None
+        self._reused = None
         self.player = GameMeta.PLAYERS["white"]
         self.dt = time_per_move
+        self.game_time = game_time
+        self.time_manager = None
         self.opponent_move = ""
+        self.opponent_action = None
 
 
         self.f = None
@@ -36,6 +53,8 @@ class Agent():
             "rollouts": [],
             "nodes": [],
             "moves": [],
+            "pondered": [],
+            "reused": [],
         }
 
         self.verbose = verbose
@@ -70,6 +89,12 @@ class Agent():
         data = self._s.recv(1024).decode("utf-8").strip().split(";")
         if (data[0] == "START"):
             self._board_size = int(data[1])
+            state = GameState(self._board_size)
+            if self.workers > 1:
+                self.agent = RootParallelAgent(BridgetMctsAgent, state, workers=self.workers)
+            else:
+                self.agent = BridgetMctsAgent(state)
+            self.time_manager = TimeManager(self.game_time or self.dt * (self._board_size ** 2 + 1) // 2)
             for i in range(self._board_size):
                 for j in range(self._board_size):
                     self._choices.append((i, j))
@@ -89,45 +114,52 @@ class Agent():
         a coinflip.
         """
         if self._turn_count == 1 and self._colour == "B":
-            move = self.agent.root_state.str_to_action(self.opponent_move)
-            if GameMeta.SWAP_MATRIX[move]:
+            tables = self.agent.root_state.tables
+            if tables.swap[tables.index(*self.opponent_action)]:
                 self._s.sendall(bytes("SWAP", "utf-8"))
                 self.bench["rollouts"].append(None)
                 self.bench["nodes"].append(None)
                 self.bench["moves"].append([self.opponent_move, "swap"])
+                self.bench["pondered"].append(self._pondered)
+                self.bench["reused"].append(self._reused)
 
                 return 4
 
-        if 8 < self._turn_count < 20:
-            self.agent.search(self.dt * 2)
+        start_time = clock()
+        target, maximum = self.time_manager.allocate(self.agent.root_state)
+        if isinstance(self.agent, RootParallelAgent):
+            # the workers cannot be polled mid-search
+            self.agent.search(target)
         else:
-            self.agent.search(self.dt)
+            self.agent.search(maximum, until=self.time_manager.should_stop)
 
         move = self.agent.best_move()
+        r, c = move
+        # reply first, the bookkeeping and re-rooting below can wait
+        self._s.sendall(bytes(f"{r},{c}\n", "utf-8"))
+        self.time_manager.spend(clock() - start_time)
 
-        rollouts, nodes, _ = self.agent.statistics()
+        rollouts, nodes, _, _ = self.agent.statistics()
         move_str = self.agent.root_state.action_to_str(move)
         both_moves = [move_str, self.opponent_move] if self.player == 1 else [self.opponent_move, move_str]
 
         self.bench["rollouts"].append(rollouts)
         self.bench["nodes"].append(nodes)
         self.bench["moves"].append(both_moves)
+        self.bench["pondered"].append(self._pondered)
+        self.bench["reused"].append(self._reused)
 
         self.agent.move(move)
 
         if self.verbose:
-            print("rollouts / nodes: ", self.agent.statistics())
+            print("rollouts / nodes / time / bytes per node: ", self.agent.statistics())
+            print("pondered / reused: ", self._pondered, self._reused)
             print(self.agent.root_state)
 
 
         if self.f:
             self.f.write(f"{move_str}\n")
 
-        r, c = move
-        msg = f"{r},{c}\n"
-
-        self._s.sendall(bytes(msg, "utf-8"))
-
         return 4
 
     def _wait_message(self):
@@ -135,7 +167,9 @@ class Agent():
 
         self._turn_count += 1
 
+        self._start_pondering()
         data = self._s.recv(1024).decode("utf-8").strip().split(";")
+        self._stop_pondering()
 
         if (data[0] == "END" or data[-1] == "END"):
             return 5
@@ -155,7 +189,11 @@ class Agent():
 
         if data[-1] == self._colour:
             move = tuple(map(int, data[1].split(",")))
+            self.opponent_action = move
             self.agent.move(move)
+            if self.ponder:
+                # rollouts already below the opponent's move, pondered or not
+                self._reused = self.agent.root_visits()
 
 
             self.opponent_move = self.agent.root_state.action_to_str(move)
@@ -167,10 +205,33 @@ class Agent():
 
         return 4
 
+    def _start_pondering(self):
+        """Search on the opponent's time in a background thread."""
+        self._pondered = None
+        self._reused = None
+        if not self.ponder:
+            return
+
+        self._ponder_stop = Event()
+        self._ponder_visits = self.agent.root_visits()
+        self._ponder_thread = Thread(target=self.agent.ponder, args=(self._ponder_stop,), daemon=True)
+        self._ponder_thread.start()
+
+    def _stop_pondering(self):
+        if self._ponder_thread is None:
+            return
+
+        self._ponder_stop.set()
+        self._ponder_thread.join()
+        self._ponder_thread = None
+        self._pondered = self.agent.root_visits() - self._ponder_visits
+
     def _close(self):
         """Closes the socket."""
         self._s.close()
         # print("socket closed")
+        if isinstance(self.agent, RootParallelAgent):
+            self.agent.close()
         if self.f:
             self.f.close()
 
@@ -0,0 +1,151 @@
+from copy import deepcopy
+from random import choice
+
+import numpy as np
+
+from array_tree import ArrayTree
+from game import GameState, GameMeta
+from mcts import MCTS_ARGS
+from agents.grave import GRaveMctsAgent
+from rollouts import RolloutBatch
+from selection import pick, grave_scores
+
+class ArrayGRaveMctsAgent(GRaveMctsAgent):
+    """
+    GRaveMctsAgent on an ArrayTree: node statistics live in preallocated
+    arrays instead of RaveNode objects, so expansion allocates no Python
+    objects and move() re-roots the kept subtree in place. Selection and
+    backup work on node indices; the path from the root is what select_node
+    hands to backup.
+
+    """
+    def __init__(self, state: GameState = None, rollout: str = None,
+                 node_budget: int = None, memory_budget: int = None):
+        self.tree = ArrayTree()
+        super().__init__(state, rollout, node_budget=node_budget, memory_budget=memory_budget)
+
+    def set_gamestate(self, state: GameState) -> None:
+        self.root_state = deepcopy(state)
+        self.scratch_state = deepcopy(state)
+        self.tree.clear()
+
+    def scores(self, node: int, ref: int = -1) -> np.ndarray:
+        """
+        GRAVE scores of the children of node. ref is the nearest node on the
+        selection path with at least GRAVE_REF visits and the same player
+        to move as node; the AMAF statistics of its children are scattered
+        by move onto node's children.
+
+        """
+        tree = self.tree
+        children = tree.children(node)
+        moves = tree.move[children.start:children.stop]
+        ref_N_RAVE = ref_Q_RAVE = None
+        if ref >= 0 and ref != node:
+            ref_children = tree.children(ref)
+            ref_moves = tree.move[ref_children.start:ref_children.stop]
+            by_move = np.zeros((2, self.root_state.tables.cells))
+            by_move[0, ref_moves] = tree.N_RAVE[ref_children.start:ref_children.stop]
+            by_move[1, ref_moves] = tree.Q_RAVE[ref_children.start:ref_children.stop]
+            ref_N_RAVE, ref_Q_RAVE = by_move[:, moves]
+
+        return grave_scores(tree.N[children.start:children.stop],
+                            tree.Q[children.start:children.stop],
+                            tree.N_RAVE[children.start:children.stop],
+                            tree.Q_RAVE[children.start:children.stop],
+                            tree.N[node], MCTS_ARGS.EXPLORATION, MCTS_ARGS.RAVE_CONST,
+                            MCTS_ARGS.GRAVE_REF, ref_N_RAVE, ref_Q_RAVE)
+
+    def select_node(self) -> tuple:
+        tree = self.tree
+        node = tree.root
+        refs = [-1, -1]
+        path = [node]
+        state = self.scratch_state
+        state.copy_from(self.root_state)
+
+        while tree.num_children[node]:
+            parity = len(path) % 2
+            if tree.N[node] >= MCTS_ARGS.GRAVE_REF:
+                refs[parity] = node
+            node = tree.first_child[node] + pick(self.scores(node, refs[parity]))
+            state.play(state.move_at(int(tree.move[node])))
+            path.append(node)
+
+            if tree.N[node] == 0:
+                self.max_depth = max(self.max_depth, len(path) - 1)
+                return path, state
+
+        # the arrays cannot be pruned in place, a full tree only stops growing
+        if (self.node_limit is None or tree.size < self.node_limit) and self.expand(node, state):
+            self.expansions += 1
+            self.expanded_children += int(tree.num_children[node])
+            node = choice(tree.children(node))
+            state.play(state.move_at(int(tree.move[node])))
+            path.append(node)
+        self.max_depth = max(self.max_depth, len(path) - 1)
+        return path, state
+
+    def expand(self, node: int, state: GameState) -> bool:
+        if state.winner != GameMeta.PLAYERS["none"]:
+            return False
+
+        self.tree.add_children(node, [state.cell_of(move) for move in state.moves()])
+        return True
+
+    def backup(self, path: list, player: int, outcome: int, rave_pts: dict) -> None:
+        tree = self.tree
+        batch = outcome if isinstance(outcome, RolloutBatch) else RolloutBatch.single(outcome, rave_pts)
+        playouts = batch.playouts
+        reward = playouts - 2 * batch.wins[player]
+
+        for node in reversed(path):
+            if tree.num_children[node]:
+                children = tree.children(node)
+                moves = tree.move[children.start:children.stop]
+                count, won = batch.amaf[player]
+                tree.N_RAVE[children.start:children.stop] += count[moves]
+                tree.Q_RAVE[children.start:children.stop] += 2 * won[moves] - count[moves]
+
+            tree.N[node] += playouts
+            tree.Q[node] += reward
+            player = 3 - player
+            reward = -reward
+
+    def move(self, move: tuple) -> None:
+        tree = self.tree
+        cell = self.root_state.cell_of(move)
+        self.root_state.play(move)
+
+        for child in tree.children(tree.root):
+            if tree.move[child] == cell:
+                tree.reroot(child)
+                return
+        tree.clear()
+
+    def best_move(self) -> tuple:
+        if self.root_state.winner != GameMeta.PLAYERS['none']:
+            return GameMeta.GAME_OVER
+
+        tree = self.tree
+        children = tree.children(tree.root)
+        N = tree.N[children.start:children.stop]
+        best = children.start + pick(N)
+        return self.root_state.move_at(int(tree.move[best]))
+
+    def root_visits(self) -> int:
+        return int(self.tree.N[self.tree.root])
+
+    def leading_visits(self) -> tuple:
+        children = self.tree.children(self.tree.root)
+        N = np.concatenate((self.tree.N[children.start:children.stop], (0, 0)))
+        second, first = np.partition(N, -2)[-2:]
+        return int(first), int(second)
+
+    def tree_size(self) -> int:
+        return self.tree.size
+
+    def node_bytes(self) -> int:
+        tree = self.tree
+        return sum(getattr(tree, name).itemsize for name in
+                   ArrayTree.STATS + ('move', 'parent', 'first_child', 'num_children'))
@@ -1,34 +1,76 @@
+from copy import deepcopy
+
 from agents.grave import GRaveMctsAgent
-from bridge_state import BridgeState
-from game import GameMeta
-from random import choice
+from bridge_state import BridgeState, FlatBridgeState
+from flat_state import FlatGameState
+from game import GameState, GameMeta
 
 class BridgetMctsAgent(GRaveMctsAgent):
-    def roll_out(self, state):
-        state = BridgeState(state)
-        moves = state.moves()
+    """
+    GRAVE with playouts that answer every intrusion into a bridge. The
+    bridges of the root position are computed once per root; a playout from
+    the selected leaf resets a pooled scratch BridgeState to them in place
+    and replays the moves of the selection path, instead of building a new
+    BridgeState from the leaf.
+
+    """
+    def __init__(self, state: GameState = None, rollout: str = None, transpositions: int = None,
+                 node_budget: int = None, memory_budget: int = None):
+        super().__init__(state, rollout, transpositions, node_budget, memory_budget)
+        self.bridge_root = None
+        self.bridge_scratch = None
+        self.leaf = None
+
+    @staticmethod
+    def bridge_state(state: GameState) -> BridgeState:
+        if isinstance(state, FlatGameState):
+            return FlatBridgeState(state)
+        return BridgeState(state)
+
+    def select_node(self) -> tuple:
+        node, state = super().select_node()
+        self.leaf = node
+        return node, state
+
+    def bridge_path(self, state: GameState) -> BridgeState:
+        """
+        Bridge state of state. For the scratch state of the last selection
+        this is the root's bridge state, rebuilt only when the root has moved
+        on, with the moves from the root to the leaf played on top; any
+        other state gets a fresh BridgeState.
+
+        """
+        moves = []
+        node = self.leaf
+        while node is not None and node is not self.root:
+            moves.append(node.move)
+            node = node.parent
+        if state is not self.scratch_state or node is None:
+            return self.bridge_state(state)
 
+        root = self.root_state
+        base = self.bridge_root
+        if base is None or base.tables is not root.tables or base.hash != root.hash \
+                or isinstance(base, FlatGameState) != isinstance(root, FlatGameState):
+            base = self.bridge_root = self.bridge_state(root)
+            self.bridge_scratch = deepcopy(base)
+
+        scratch = self.bridge_scratch
+        scratch.copy_from(base)
+        for move in reversed(moves):
+            scratch.play(move)
+        return scratch
+
+    def roll_out(self, state):
+        state = self.bridge_path(state)
         while state.bridge_winner() == GameMeta.PLAYERS["none"]:
-            move = choice(moves)
+            move = state.random_move()
             bridge_move = state.get_bridge(move,  3 - state.to_play)
             state.play(move)
-            moves.remove(move)
 
             while bridge_move is not None:
                 move = bridge_move
                 bridge_move = state.get_bridge(move,  3 - state.to_play)
                 state.play(move)
-                moves.remove(move)
-
-        rave_pts = {
-            GameMeta.PLAYERS['white']: [],
-            GameMeta.PLAYERS['black']: [],
-        }
-
-
-        for x in range(state.size):
-            for y in range(state.size):
-                if state.board[x, y]:
-                    rave_pts[state.board[x, y]].append((x,y))
 
-        return state.bridge_winner(), rave_pts
+        return state.bridge_winner(), state.stone_masks()
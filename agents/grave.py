@@ -1,16 +1,20 @@
 from math import sqrt, log
-from copy import deepcopy
 from random import choice, random
 from time import time as clock
 
-from game import GameState
 from mcts import MCTS_ARGS
 from game import GameMeta
 from agents.rave import RaveNode, RaveMctsAgent
+from selection import gather, grave_scores
 
 class GRaveNode(RaveNode):
     @property
     def value(self, explore_weight=MCTS_ARGS.EXPLORATION, rave_const=MCTS_ARGS.RAVE_CONST, ref=MCTS_ARGS.GRAVE_REF):
+        """
+        Value with the node's own AMAF statistics. During search the
+        reference node's statistics come in through scores() instead.
+
+        """
         if self.N == 0:
             return 0 if explore_weight == 0 else GameMeta.INF
 
@@ -18,52 +22,32 @@ class GRaveNode(RaveNode):
         exploit = self.Q / self.N
         UCT = exploit + explore_weight * explore
 
-        N_RAVE = self.N_RAVE
-        Q_RAVE = self.Q_RAVE
         alpha = 0
         AMAF = 0
 
         if self.N_RAVE < ref:
-            node = self
-            c = 0
-            while node.parent is not None:
-                c += 1
-                node = node.parent
-                if node.N_RAVE >= ref:
-                    N_RAVE = node.N_RAVE
-                    Q_RAVE = node.Q_RAVE
-                    break
             alpha = max(0, (rave_const - self.N) / rave_const)
             AMAF = self.Q_RAVE / self.N_RAVE if self.N_RAVE != 0 else 0
 
         return (1 - alpha) * UCT + alpha * AMAF
 
+    @classmethod
+    def scores(cls, children: list, parent: RaveNode, ref: RaveNode = None):
+        """
+        ref is the nearest node on the selection path with at least
+        GRAVE_REF visits and the same player to move as parent, an even
+        number of plies up, tracked by select_node; its AMAF array holds
+        the statistics of the same cells, so no child walks its ancestors.
 
-class GRaveMctsAgent(RaveMctsAgent):
-    def set_gamestate(self, state: GameState) -> None:
-        self.root_state = deepcopy(state)
-        self.root = RaveNode()
-
-    def move(self, move: tuple) -> None:
-        if move in self.root.children:
-            child = self.root.children[move]
-            child.parent = None
-            self.root = child
-            self.root_state.play(child.move)
-            return
-
-        self.root_state.play(move)
-        self.root = RaveNode()
-
-    @staticmethod
-    def expand(parent: RaveNode, state: GameState) -> bool:
-        children = []
-        if state.winner != GameMeta.PLAYERS["none"]:
-            # game is over at this node so nothing to expand
-            return False
+        """
+        N, Q = gather(children, 'N', 'Q')
+        N_RAVE, Q_RAVE = parent.rave_stats[:, parent.child_cells]
+        ref_N_RAVE = ref_Q_RAVE = None
+        if ref is not None and ref is not parent:
+            ref_N_RAVE, ref_Q_RAVE = ref.rave_stats[:, parent.child_cells]
+        return grave_scores(N, Q, N_RAVE, Q_RAVE, parent.N, MCTS_ARGS.EXPLORATION,
+                            MCTS_ARGS.RAVE_CONST, MCTS_ARGS.GRAVE_REF, ref_N_RAVE, ref_Q_RAVE)
 
-        for move in state.moves():
-            children.append(RaveNode(move, parent))
 
-        parent.add_children(children)
-        return True
+class GRaveMctsAgent(RaveMctsAgent):
+    node_type = GRaveNode
@@ -1,17 +1,47 @@
 from math import sqrt, log
 from copy import deepcopy
-from random import choice, random
+from random import random
 from time import time as clock
 
+import numpy as np
+
 from game import GameState, GameMeta
 from mcts import Node, MCTS, MCTS_ARGS
+from rollouts import random_rollout, RolloutBatch
+from selection import gather, rave_scores
 
 class RaveNode(Node):
-    def __init__(self, move: tuple = None, parent: Node = None):
+    """
+    The AMAF statistics of a node's children live in one (2, cells) array
+    on the node, rows N_RAVE and Q_RAVE indexed by flat cell, so a playout
+    is backed up with a single vector add per node. A child reads its own
+    entry through the N_RAVE and Q_RAVE properties. The array covers every
+    cell, including the untried ones not yet materialised as children.
+
+    """
+    def __init__(self, move: tuple = None, parent: Node = None, cell: int = None):
         super().__init__(move, parent)
 
-        self.Q_RAVE = 0
-        self.N_RAVE = 0
+        self.cell = cell
+        self.child_cells = None
+        self.untried = None
+        self.rave_stats = None
+
+    def collapse(self) -> None:
+        # expand() rebuilds them when the leaf is reached again
+        self.rave_stats = self.child_cells = self.untried = None
+
+    def relink(self, parent: Node, index: int) -> None:
+        super().relink(parent, index)
+        self.cell = parent.child_cells[index]
+
+    @property
+    def N_RAVE(self) -> float:
+        return self.parent.rave_stats[0, self.cell] if self.parent is not None else 0
+
+    @property
+    def Q_RAVE(self) -> float:
+        return self.parent.rave_stats[1, self.cell] if self.parent is not None else 0
 
     @property
     def value(self, explore: float = MCTS_ARGS.EXPLORATION, rave_const: float = MCTS_ARGS.RAVE_CONST) -> float:
@@ -24,65 +54,104 @@ class RaveNode(Node):
 
         return (1 - alpha) * UCT + alpha * AMAF
 
+    @classmethod
+    def scores(cls, children: list, parent: Node, ref: Node = None):
+        N, Q = gather(children, 'N', 'Q')
+        N_RAVE, Q_RAVE = parent.rave_stats[:, parent.child_cells]
+        return rave_scores(N, Q, N_RAVE, Q_RAVE, parent.N, MCTS_ARGS.EXPLORATION, MCTS_ARGS.RAVE_CONST)
+
 
 class RaveMctsAgent(MCTS):
+    """
+    Children are materialised progressively: an expanded node starts with
+    K_CONST children and grows to K_CONST * N ** A_CONST, adding the
+    untried cells in order of their AMAF value, so most nodes never
+    allocate, or score, the moves selection would not pick.
+
+    """
+    LOSS_REWARD = -1
+    node_type = RaveNode
+
     def set_gamestate(self, state: GameState) -> None:
+        self.release()
         self.root_state = deepcopy(state)
-        self.root = RaveNode()
+        self.scratch_state = deepcopy(state)
+        self.root = self.node_type()
 
     def move(self, move: tuple) -> None:
         if move in self.root.children:
             child = self.root.children[move]
+            self.release(child)
             child.parent = None
             self.root = child
-            self.root_state.play(child.move)
+            self.root_state.play(move)
             return
 
+        self.release()
         self.root_state.play(move)
-        self.root = RaveNode()
+        self.root = self.node_type()
 
-    @staticmethod
-    def expand(parent: RaveNode, state: GameState) -> bool:
-        children = []
+    def expand(self, parent: RaveNode, state: GameState) -> bool:
         if state.winner != GameMeta.PLAYERS["none"]:
             return False
 
-        for move in state.moves():
-            children.append(RaveNode(move, parent))
-
-        parent.add_children(children)
+        parent.untried = np.array([state.cell_of(move) for move in state.moves()], dtype=np.intp)
+        parent.child_cells = np.empty(0, dtype=np.intp)
+        parent.rave_stats = np.zeros((2, state.tables.cells))
+        self.widen(parent, state)
         return True
 
-    @staticmethod
-    def roll_out(state: GameState) -> tuple:
-        moves = state.moves()
-        while state.winner == GameMeta.PLAYERS["none"]:
-            move = choice(moves)
-            state.play(move)
-            moves.remove(move)
-
-        rave_pts = {
-           GameMeta.PLAYERS['white']: [],
-           GameMeta.PLAYERS['black']: [],
-        }
-
-        for x in range(state.size):
-            for y in range(state.size):
-                if state.board[x, y]:
-                    rave_pts[state.board[x, y]].append((x,y))
-
-        return state.winner, rave_pts
+    def widen(self, node: RaveNode, state: GameState) -> list:
+        """
+        Materialise the best untried cells of node until it has K_CONST *
+        N ** A_CONST children. Cells are ranked by their AMAF value at node
+        plus, as a prior, at its grandparent, where the same player moves;
+        unseen cells rank as even and ties are broken at random.
+
+        """
+        untried = node.untried
+        if untried is None or not untried.size:
+            return []
+        count = min(int(MCTS_ARGS.K_CONST * max(node.N, 1) ** MCTS_ARGS.A_CONST) - len(node.children),
+                    untried.size)
+        if count <= 0:
+            return []
+
+        N_RAVE, Q_RAVE = node.rave_stats[:, untried]
+        prior = node.parent.parent if node.parent is not None else None
+        if prior is not None and prior.rave_stats is not None:
+            N_RAVE = N_RAVE + prior.rave_stats[0, untried]
+            Q_RAVE = Q_RAVE + prior.rave_stats[1, untried]
+        AMAF = Q_RAVE / np.maximum(N_RAVE, 1)
+        best = np.lexsort((np.random.random(untried.size), -AMAF))[:count]
+
+        cells = untried[best]
+        node.untried = np.delete(untried, best)
+        node.child_cells = np.concatenate((node.child_cells, cells))
+        children = [self.node_type(state.move_at(cell), node, cell) for cell in cells.tolist()]
+        node.add_children(children)
+        return [child.move for child in children]
+
+    roll_out = staticmethod(random_rollout)
 
     def backup(self, node: RaveNode, player: int, outcome: int, rave_pts: dict) -> None:
-        reward = -1 if outcome == player else 1
+        """
+        rave_pts holds one boolean stone mask over the cells per player, or
+        outcome is a RolloutBatch with per-cell AMAF count arrays. Every
+        node on the path adds the counts of the player to move there to its
+        children's AMAF statistics in one scatter.
+
+        """
+        batch = outcome if isinstance(outcome, RolloutBatch) else RolloutBatch.single(outcome, rave_pts)
+        reward = batch.playouts - 2 * batch.wins[player]
 
         while node is not None:
-            for point in rave_pts[player]:
-                if point in node.children:
-                    node.children[point].Q_RAVE += -reward
-                    node.children[point].N_RAVE += 1
+            if node.children:
+                count, won = batch.amaf[player]
+                node.rave_stats[0] += count
+                node.rave_stats[1] += 2 * won - count
 
-            node.N += 1
+            node.N += batch.playouts
             node.Q += reward
             player = 3 - player
             reward = -reward
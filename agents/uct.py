@@ -1,10 +1,11 @@
 from math import sqrt, log
 from copy import deepcopy
 from queue import Queue
-from random import choice
 from time import time as clock
 from game import GameState, GameMeta
 from mcts import Node, MCTS, MCTS_ARGS
+from rollouts import random_rollout, RolloutBatch
+from selection import gather, uct_scores
 
 class UctNode(Node):
     @property
@@ -14,8 +15,15 @@ class UctNode(Node):
         else:
             return self.Q / self.N + explore * sqrt(2 * log(self.parent.N) / self.N)
 
+    @classmethod
+    def scores(cls, children: list, parent: Node, ref: Node = None):
+        N, Q = gather(children, 'N', 'Q')
+        return uct_scores(N, Q, parent.N, MCTS_ARGS.EXPLORATION)
+
 
 class UctMctsAgent(MCTS):
+    LOSS_REWARD = 0
+
     @staticmethod
     def expand(parent: Node, state: GameState) -> bool:
         children = []
@@ -23,24 +31,25 @@ class UctMctsAgent(MCTS):
             return False
 
         for move in state.moves():
-            children.append(Node(move, parent))
+            children.append(UctNode(move, parent))
 
         parent.add_children(children)
         return True
 
-    @staticmethod
-    def roll_out(state: GameState) -> int:
-        moves = state.moves()
-
-        while state.winner == GameMeta.PLAYERS['none']:
-            move = choice(moves)
-            state.play(move)
-            moves.remove(move)
-
-        return state.winner
+    roll_out = staticmethod(random_rollout)
 
     @staticmethod
-    def backup(node: Node, turn: int, outcome: int) -> None:
+    def backup(node: Node, turn: int, outcome: int, rave_pts: dict = None) -> None:
+        if isinstance(outcome, RolloutBatch):
+            visits = outcome.playouts
+            reward = visits - outcome.wins[turn]
+            while node is not None:
+                node.N += visits
+                node.Q += reward
+                node = node.parent
+                reward = visits - reward
+            return
+
         reward = 0 if outcome == turn else 1
 
         while node is not None:
@@ -52,14 +61,18 @@ class UctMctsAgent(MCTS):
     def move(self, move: tuple) -> None:
         if move in self.root.children:
             child = self.root.children[move]
+            self.release(child)
             child.parent = None
             self.root = child
-            self.root_state.play(child.move)
+            self.root_state.play(move)
             return
 
+        self.release()
         self.root_state.play(move)
         self.root = Node()
 
     def set_gamestate(self, state: GameState) -> None:
+        self.release()
         self.root_state = deepcopy(state)
+        self.scratch_state = deepcopy(state)
         self.root = Node()
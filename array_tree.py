@@ -0,0 +1,101 @@
+import numpy as np
+
+class ArrayTree:
+    """
+    Search tree kept as parallel NumPy arrays instead of node objects. A
+    node is an index; its children occupy the contiguous index range
+    first_child .. first_child + num_children. Moves are stored as flat
+    cell indices. Arrays grow by doubling and are never shrunk, so nodes
+    are reused in place after a re-root.
+
+    """
+    STATS = ('N', 'Q', 'N_RAVE', 'Q_RAVE')
+
+    def __init__(self, capacity: int = 1 << 16):
+        self.capacity = capacity
+        self.N = np.zeros(capacity)
+        self.Q = np.zeros(capacity)
+        self.N_RAVE = np.zeros(capacity)
+        self.Q_RAVE = np.zeros(capacity)
+        self.move = np.full(capacity, -1, dtype=np.int32)
+        self.parent = np.full(capacity, -1, dtype=np.int32)
+        self.first_child = np.full(capacity, -1, dtype=np.int32)
+        self.num_children = np.zeros(capacity, dtype=np.int32)
+        self.root = 0
+        self.size = 1
+
+    def _grow(self, needed: int) -> None:
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        for name in self.STATS:
+            setattr(self, name, np.concatenate((getattr(self, name), np.zeros(capacity - self.capacity))))
+        for name, fill in (('move', -1), ('parent', -1), ('first_child', -1), ('num_children', 0)):
+            extra = np.full(capacity - self.capacity, fill, dtype=np.int32)
+            setattr(self, name, np.concatenate((getattr(self, name), extra)))
+        self.capacity = capacity
+
+    def _wipe(self, start: int) -> None:
+        for array in (self.N, self.Q, self.N_RAVE, self.Q_RAVE):
+            array[start:self.size] = 0
+        for array in (self.move, self.parent, self.first_child):
+            array[start:self.size] = -1
+        self.num_children[start:self.size] = 0
+
+    def clear(self) -> None:
+        self._wipe(0)
+        self.root = 0
+        self.size = 1
+
+    def add_children(self, node: int, moves: list) -> None:
+        start = self.size
+        end = start + len(moves)
+        if end > self.capacity:
+            self._grow(end)
+        self.move[start:end] = moves
+        self.parent[start:end] = node
+        self.first_child[node] = start
+        self.num_children[node] = len(moves)
+        self.size = end
+
+    def children(self, node: int) -> range:
+        start = self.first_child[node]
+        return range(start, start + self.num_children[node])
+
+    def subtree(self, node: int) -> np.ndarray:
+        """Nodes of the subtree rooted at node in breadth-first order."""
+        levels = [np.array([node])]
+        frontier = levels[0]
+        while frontier.size:
+            counts = self.num_children[frontier]
+            starts = self.first_child[frontier][counts > 0]
+            counts = counts[counts > 0]
+            if not counts.size:
+                break
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            frontier = np.repeat(starts, counts) + offsets
+            levels.append(frontier)
+        return np.concatenate(levels)
+
+    def reroot(self, node: int) -> None:
+        """
+        Make node the root and compact its subtree to the front of the
+        arrays. Breadth-first order keeps every child range contiguous; the
+        rest of the old tree is dropped.
+
+        """
+        order = self.subtree(node)
+        kept = order.size
+        new_index = np.full(self.size, -1, dtype=np.int32)
+        new_index[order] = np.arange(kept, dtype=np.int32)
+
+        for array in (self.N, self.Q, self.N_RAVE, self.Q_RAVE, self.move, self.num_children):
+            array[:kept] = array[order]
+        self.parent[:kept] = new_index[self.parent[order]]
+        self.parent[0] = -1
+        first_child = self.first_child[order]
+        self.first_child[:kept] = np.where(first_child >= 0, new_index[first_child], -1)
+
+        self._wipe(kept)
+        self.root = 0
+        self.size = kept
@@ -0,0 +1,201 @@
+"""Rollout throughput of the state backends"""
+from copy import deepcopy
+from threading import Event, Thread
+from random import shuffle
+from time import sleep, time as clock
+
+from agents.rave import RaveMctsAgent
+from agents.grave import GRaveMctsAgent
+from agents.bridget import BridgetMctsAgent
+from agents.array_grave import ArrayGRaveMctsAgent
+from bit_state import BitGameState
+from flat_state import FlatGameState
+from game import BoardTables, GameState
+from mcts import MCTS_ARGS
+from parallel import PipelinedSearch
+from rollouts import fill_rollout, batch_rollout, BATCH_PLAYOUTS
+
+BACKENDS = {
+    "GameState": GameState,
+    "FlatGameState": FlatGameState,
+    "BitGameState": BitGameState,
+}
+
+def rollouts_per_sec(roll_out, state, duration=2):
+    start_time = clock()
+    count = 0
+    while clock() - start_time < duration:
+        roll_out(deepcopy(state))
+        count += 1
+    return count / (clock() - start_time)
+
+def filled_winners_per_sec(state, duration=2):
+    """Winners of shuffled full boards from state, timing the connectivity test alone."""
+    elapsed = 0
+    count = 0
+    while elapsed < duration:
+        filled = deepcopy(state)
+        cells = filled.moves()
+        shuffle(cells)
+        filled.fill(cells)
+        start_time = clock()
+        filled.filled_winner()
+        elapsed += clock() - start_time
+        count += 1
+    return count / elapsed
+
+def search_rollouts_per_sec(agent_cls, state, duration=2, rollout=None):
+    agent = agent_cls(state, rollout=rollout)
+    agent.search(duration)
+    rollouts, _, run_time, _ = agent.statistics()
+    return rollouts / run_time
+
+def root_visits(agent) -> dict:
+    """Share of the root visits each root move received."""
+    children = agent.root.children
+    total = sum(child.N for child in children.values()) or 1
+    return {move: child.N / total for move, child in children.items()}
+
+def visit_distance(first: dict, second: dict) -> float:
+    """Total variation distance between two root visit distributions."""
+    return sum(abs(first.get(move, 0) - second.get(move, 0)) for move in first.keys() | second.keys()) / 2
+
+def pipelined_rollouts_per_sec(agent_cls, state, duration=2):
+    """
+    Rollout rate of a PipelinedSearch and what its virtual loss costs: the
+    same number of fill rollouts is searched sequentially, twice, for the
+    speedup and for the noise floor of the root visit distribution that
+    the pipelined one is compared against, along with the best move.
+
+    """
+    pipeline = PipelinedSearch(agent_cls(state))
+    pipeline.search(duration)
+    rollouts, _, run_time, _ = pipeline.statistics()
+    pipeline.close()
+
+    sequential = []
+    for _ in range(2):
+        agent = agent_cls(state, rollout=pipeline.engine)
+        agent.search(float('inf'), until=lambda agent, elapsed, done: done >= rollouts)
+        sequential.append(agent)
+    first, second = sequential
+    sequential_rate = first.num_rollouts / first.run_time
+    agree = sum(agent.best_move() == pipeline.best_move() for agent in sequential)
+    print(f"{'PipelinedSearch':>24} {type(state).__name__:>16} "
+          f"speedup x{rollouts / run_time / sequential_rate:.2f}  "
+          f"visit distance {visit_distance(root_visits(pipeline.agent), root_visits(first)):.3f} "
+          f"(sequential {visit_distance(root_visits(first), root_visits(second)):.3f})  "
+          f"best move agrees {agree}/2 (sequential {int(first.best_move() == second.best_move())}/1)")
+    return rollouts / run_time
+
+def grave_ref_lookups(agent) -> tuple:
+    """
+    Ancestor lookups an evaluation-time GRAVE reference walk would need for
+    the selections of a finished search, against the one reference update
+    per tree level that select_node does now.
+
+    """
+    walked = tracked = 0
+    stack = [agent.root]
+    while stack:
+        node = stack.pop()
+        children = list(node.children.values())
+        if not children:
+            continue
+        tracked += node.N
+        for child in children:
+            if child.N_RAVE < MCTS_ARGS.GRAVE_REF:
+                ancestor, hops = node, 1
+                while ancestor.parent is not None and ancestor.N_RAVE < MCTS_ARGS.GRAVE_REF:
+                    ancestor, hops = ancestor.parent, hops + 1
+                walked += node.N * hops
+            stack.append(child)
+    return walked, tracked
+
+def transposition_report(agent_cls, state, duration=2):
+    for capacity in (None, MCTS_ARGS.TT_CAPACITY):
+        agent = agent_cls(state, rollout="fill", transpositions=capacity)
+        agent.search(duration)
+        rollouts, nodes, run_time, _ = agent.statistics()
+        hit_rate, saved = agent.transposition_statistics()
+        print(f"{'transpositions':>24} {str(capacity):>16} {rollouts / run_time:10.1f}/s  "
+              f"nodes {nodes}  hit rate {hit_rate:.3f}  rollouts saved {saved}")
+
+def ponder_reuse(agent_cls, state, duration=2):
+    """Rollouts pondered on the opponent's time and kept after its reply."""
+    agent = agent_cls(state)
+    agent.search(duration)
+    agent.move(agent.best_move())
+    start_visits = agent.root_visits()
+    stop = Event()
+    thread = Thread(target=agent.ponder, args=(stop,))
+    thread.start()
+    sleep(duration)
+    stop.set()
+    thread.join()
+    pondered = agent.root_visits() - start_visits
+    # the opponent answers with the reply the ponder search liked best
+    agent.move(agent.best_move())
+    print(f"{'pondering':>24} {agent_cls.__name__:>16} pondered {pondered}  reused {agent.root_visits()}")
+
+def scaling_report(sizes=range(9, 20, 2), duration=2):
+    """Table build time, search rollouts/s and memory per node by board size."""
+    for size in sizes:
+        start_time = clock()
+        BoardTables(size)
+        build_time = clock() - start_time
+        for rollout in (None, "fill"):
+            agent = GRaveMctsAgent(FlatGameState(size), rollout=rollout)
+            agent.search(duration)
+            rollouts, nodes, run_time, node_bytes = agent.statistics()
+            print(f"{'size ' + str(size):>24} {str(rollout or 'random'):>16} {rollouts / run_time:10.1f}/s  "
+                  f"nodes {nodes}  bytes per node {node_bytes}  tables {build_time * 1000:.1f}ms")
+
+def report(name, rates):
+    base = next(iter(rates.values()))
+    for backend, rate in rates.items():
+        print(f"{name:>24} {backend:>16} {rate:10.1f}/s  x{rate / base:.2f}")
+
+if __name__ == "__main__":
+    size = 11
+
+    report("RaveMctsAgent.roll_out", {
+        name: rollouts_per_sec(RaveMctsAgent.roll_out, backend(size))
+        for name, backend in BACKENDS.items()})
+    report("fill_rollout", {
+        name: rollouts_per_sec(fill_rollout, backend(size))
+        for name, backend in BACKENDS.items()})
+    report("filled-board winner", {
+        name: filled_winners_per_sec(backend(size))
+        for name, backend in BACKENDS.items()})
+    report("batch_rollout playouts", {
+        name: BATCH_PLAYOUTS * rollouts_per_sec(batch_rollout, backend(size))
+        for name, backend in BACKENDS.items()})
+    report("BridgetMctsAgent.roll_out", {
+        name: rollouts_per_sec(BridgetMctsAgent().roll_out, backend(size))
+        for name, backend in BACKENDS.items()})
+    report("GRaveMctsAgent.search", {
+        name: search_rollouts_per_sec(GRaveMctsAgent, backend(size))
+        for name, backend in BACKENDS.items()})
+    report("ArrayGRaveMctsAgent.search", {
+        name: search_rollouts_per_sec(ArrayGRaveMctsAgent, backend(size))
+        for name, backend in BACKENDS.items()})
+    report("GRaveMctsAgent.search fill", {
+        name: search_rollouts_per_sec(GRaveMctsAgent, backend(size), rollout="fill")
+        for name, backend in BACKENDS.items()})
+    report("GRaveMctsAgent.search batch", {
+        name: search_rollouts_per_sec(GRaveMctsAgent, backend(size), rollout="batch")
+        for name, backend in BACKENDS.items()})
+    report("GRaveMctsAgent pipelined", {
+        name: pipelined_rollouts_per_sec(GRaveMctsAgent, backend(size))
+        for name, backend in BACKENDS.items()})
+
+    agent = GRaveMctsAgent(FlatGameState(size), rollout="fill")
+    agent.search(2)
+    walked, tracked = grave_ref_lookups(agent)
+    print(f"{'GRAVE reference lookups':>24} {'walk':>16} {walked:10.0f}  "
+          f"tracked {tracked:.0f}  x{walked / max(tracked, 1):.1f}")
+
+    transposition_report(GRaveMctsAgent, FlatGameState(7))
+    ponder_reuse(BridgetMctsAgent, GameState(size))
+    scaling_report()
@@ -0,0 +1,36 @@
+from flat_state import FlatGameState
+from game import GameMeta
+
+# per owner, a bytes.translate table turning the board into ASCII bits of its cells
+DIGITS = {player: bytes.maketrans(bytes(GameMeta.PLAYERS.values()),
+                                  bytes(b'01'[owner == player] for owner in GameMeta.PLAYERS.values()))
+          for player in GameMeta.PLAYERS.values()}
+
+class BitGameState(FlatGameState):
+    """
+    FlatGameState answering its bulk questions on bitboards: Python ints in
+    which bit i stands for flat cell i. A player's stones, or the empty
+    cells, are read off the list board in one bytes.translate pass, and
+    connectivity is a flood fill of shifts and masks (BoardTables.grow).
+    Single stones still go to the list board and the union-find in play();
+    updating a bitboard there as well costs more per move than one pass
+    per playout.
+
+    """
+    def stone_bits(self, player: int) -> int:
+        """Bitboard of the cells owned by player, PLAYERS['none'] for the empty ones."""
+        return int(bytes(self.board).translate(DIGITS[player])[::-1], 2)
+
+    def empty_bits(self) -> int:
+        return self.stone_bits(GameMeta.PLAYERS['none'])
+
+    def connects(self, player: int) -> bool:
+        """Whether the player's stones join its edges, without the union-find."""
+        return self.tables.connects_bits(self.stone_bits(player), player)
+
+    def filled_winner(self) -> int:
+        # either player decides a full board; black's flood fill settles in fewer shifts
+        black = GameMeta.PLAYERS['black']
+        if self.connects(black):
+            return black
+        return GameMeta.PLAYERS['white']
@@ -1,22 +1,19 @@
 from game import GameState, GameMeta
+from flat_state import FlatGameState
 from copy import deepcopy
-from union import UnionFind
 import random
+from random import choice
 
 class BridgeState(GameState):
-    bridge_patterns = (((-1,-1), ((-1, 0),( 0,-1))),
-                       ((-2, 1), ((-1, 0),(-1, 1))),
-                       ((-1, 2), ((-1, 1),( 0, 1))),
-                       (( 1, 1), (( 1, 0),( 0, 1))),
-                       (( 2,-1), (( 1, 0),( 1,-1))),
-                       (( 1,-2), (( 1,-1),( 0,-1))))
-
     def __init__(self, state: GameState):
         self.size = state.size
+        self.tables = state.tables
         self.to_play = state.to_play
         self.board = deepcopy(state.board)
-        white_groups = deepcopy(state.groups[GameMeta.PLAYERS['white']])
-        black_groups = deepcopy(state.groups[GameMeta.PLAYERS['black']])
+        self.empty_cells = list(state.empty_cells)
+        self.empty_index = list(state.empty_index)
+        white_groups = state.groups[GameMeta.PLAYERS['white']].clone()
+        black_groups = state.groups[GameMeta.PLAYERS['black']].clone()
         self.groups = {
             GameMeta.PLAYERS['white']: white_groups,
             GameMeta.PLAYERS['black']: black_groups,
@@ -25,38 +22,67 @@ class BridgeState(GameState):
             GameMeta.PLAYERS['white']: {},
             GameMeta.PLAYERS['black']: {},
         }
+        self.links = {
+            GameMeta.PLAYERS['white']: {},
+            GameMeta.PLAYERS['black']: {},
+        }
         self.compute_bridges()
         self.lastmove = None
         self.white_played = state.white_played
         self.black_played = state.black_played
+        self._hash = state.hash
+        self.winner = self.connected_player()
 
-    def recompute_groups(self):
-        # Should ignore edges?
-        self.groups = {
-            GameMeta.PLAYERS['white']: UnionFind(),
-            GameMeta.PLAYERS['black']: UnionFind(),
-        }
+    def copy_from(self, state: 'BridgeState') -> None:
+        self.to_play = state.to_play
+        self.board[:] = state.board
+        self.empty_cells[:] = state.empty_cells
+        self.empty_index[:] = state.empty_index
+        self.white_played = state.white_played
+        self.black_played = state.black_played
+        self._hash = state._hash
+        self.winner = state.winner
+        for player, groups in self.groups.items():
+            groups.copy_from(state.groups[player])
+        self.pairs = {player: dict(pairs) for player, pairs in state.pairs.items()}
+        self.links = {player: dict(links) for player, links in state.links.items()}
+        self.lastmove = state.lastmove
+
+    def regroup(self, player, board):
+        """
+        Rebuild the connectivity of player alone from its stones on the
+        flat board and its remaining bridges.
 
-        for i in range(self.size):
-            for j in range(self.size):
-                cell = (i,j)
-                if self.board[cell] == GameMeta.PLAYERS["none"]:
-                    continue
-
-                rc = int(self.board[cell] == GameMeta.PLAYERS["black"])
-                if cell[rc] == 0:
-                    self.groups[self.board[cell]].join(GameMeta.EDGE1, cell)
-                if cell[rc] == self.size - 1:
-                    self.groups[self.board[cell]].join(GameMeta.EDGE2, cell)
-                for n in self.neighbors(cell):
-                    if self.board[n] == self.board[cell]:
-                        self.groups[self.board[cell]].join(cell, n)
+        """
+        tables = self.tables
+        groups = self.groups[player]
+        groups.reset()
+
+        for cell, owner in enumerate(board):
+            if owner != player:
+                continue
+
+            edge = tables.edges[player][cell]
+            if edge & GameMeta.EDGE1:
+                groups.join(tables.edge1, cell)
+            if edge & GameMeta.EDGE2:
+                groups.join(tables.edge2, cell)
+            for n in tables.neighbors[cell]:
+                if board[n] == player:
+                    groups.join(cell, n)
+
+        for cell1, cell2 in self.links[player].values():
+            groups.join(cell1, cell2)
 
     def compute_bridges(self):
         self.pairs = {
             GameMeta.PLAYERS['white']: {},
             GameMeta.PLAYERS['black']: {},
         }
+        self.links = {
+            GameMeta.PLAYERS['white']: {},
+            GameMeta.PLAYERS['black']: {},
+        }
         shuffled_i = list(range(self.size))
         shuffled_j = list(range(self.size))
         random.shuffle(shuffled_i)
@@ -67,51 +93,48 @@ class BridgeState(GameState):
                     self.update_bridges((i, j))
 
     def update_bridges(self, cell):
-        player = self.board[cell]
+        board = self.board
+        player = board[cell]
         pairs = self.pairs[player]
+        tables = self.tables
+        coords = tables.coords
+        index = tables.index(*cell)
 
-        shuffled_bridge_patterns = list(self.bridge_patterns)
-        random.shuffle(shuffled_bridge_patterns)
-        for b, (m1, m2) in shuffled_bridge_patterns:
-            c =  (b[0]    + cell[0], b[1]    + cell[1])
-            m1 = (m1[0] + cell[0], m1[1] + cell[1])
-            m2 = (m2[0] + cell[0], m2[1] + cell[1])
-
-            if c[0] < 0 or c[0] >= self.size or c[1] < 0 or c[1] >= self.size:
-                if m1[0] < 0 or m1[0] >= self.size or m1[1] < 0 or m1[1] >= self.size or \
-                   m2[0] < 0 or m2[0] >= self.size or m2[1] < 0 or m2[1] >= self.size:
-                    continue
-
-                rc = int(player == GameMeta.PLAYERS['black'])
-                if c[rc] == -1:
-                    c = GameMeta.EDGE1
-                elif c[rc] == self.size:
-                    c = GameMeta.EDGE2
-                else:
-                    continue
-
-            if not (self.board[m1] == self.board[m2] == GameMeta.PLAYERS["none"]):
+        carriers = tables.carriers[player][index]
+        for i in choice(GameMeta.BRIDGE_ORDERS[len(carriers)]):
+            c, m1, m2 = carriers[i]
+            m1, m2 = coords[m1], coords[m2]
+            if not (board[m1] == board[m2] == GameMeta.PLAYERS["none"]):
                 continue
 
-            if not (c == GameMeta.EDGE1 or c == GameMeta.EDGE2 or self.board[c] == player):
+            if c < tables.cells and board[coords[c]] != player:
                 continue
 
             if m1 in pairs or m2 in pairs:
                 continue
 
-            if self.groups[player].join(cell, c):
-                self.set_bridge(m1, m2, player)
-                assert self.board[m1] == self.board[m2] == 0
+            if self.groups[player].join(index, c):
+                self.set_bridge(m1, m2, player, (index, c))
 
     def clear_bridge(self, cell, player):
         if cell in self.pairs[player]:
             other = self.pairs[player][cell]
             del self.pairs[player][cell]
             del self.pairs[player][other]
+            self.links[player].pop(cell, None)
+            self.links[player].pop(other, None)
 
-    def set_bridge(self, cell1, cell2, player):
+    def set_bridge(self, cell1, cell2, player, ends=None):
+        """
+        Record the carrier pair of a bridge; ends are the two nodes it
+        joined, kept so a broken bridge can be undone by regroup().
+
+        """
         self.pairs[player][cell1] = cell2
         self.pairs[player][cell2] = cell1
+        if ends is not None:
+            self.links[player][cell1] = ends
+            self.links[player][cell2] = ends
 
 
     def get_bridge(self, cell, player=None):
@@ -122,15 +145,21 @@ class BridgeState(GameState):
         return self.pairs[player][cell]
 
 
-    def bridge_winner(self):
-        if self.groups[GameMeta.PLAYERS['white']].connected(GameMeta.EDGE1, GameMeta.EDGE2):
-            return GameMeta.PLAYERS["white"]
-        if self.groups[GameMeta.PLAYERS['black']].connected(GameMeta.EDGE1, GameMeta.EDGE2):
-            return GameMeta.PLAYERS["black"]
+    def connected_player(self):
+        """The player whose groups, bridges included, join both edges."""
+        edge1 = self.tables.edge1
+        for player, groups in self.groups.items():
+            if groups.flags_of(edge1) == GameMeta.CONNECTED:
+                return player
         return GameMeta.PLAYERS["none"]
 
-    def winner(self):
-        return self.bridge_winner
+    def bridge_winner(self):
+        """
+        Winner counting bridges as connections; winner is kept up to date
+        by play() from the edge flags of the groups it joins.
+
+        """
+        return self.winner
 
     def play(self, cell: tuple) -> None:
         if not self.board[cell] == GameMeta.PLAYERS['none']:
@@ -143,24 +172,131 @@ class BridgeState(GameState):
         self.white_played += self.to_play == GameMeta.PLAYERS['white']
         self.black_played += self.to_play == GameMeta.PLAYERS['black']
 
+        index = self.tables.index
+        self.remove_empty(index(*cell))
+        self._hash ^= self.tables.zobrist[self.to_play][index(*cell)] ^ self.tables.zobrist_turn
         rc = int(self.to_play == GameMeta.PLAYERS['black'])
         if cell[rc] == 0:
-            self.groups[self.to_play].join(GameMeta.EDGE1, cell)
+            self.groups[self.to_play].join(self.tables.edge1, index(*cell))
         if cell[rc] == self.size - 1:
-            self.groups[self.to_play].join(GameMeta.EDGE2, cell)
+            self.groups[self.to_play].join(self.tables.edge2, index(*cell))
 
         for n in self.neighbors(cell):
             if self.board[n] == self.to_play:
-                self.groups[self.to_play].join(n, cell)
+                self.groups[self.to_play].join(index(*n), index(*cell))
 
         if self.lastmove in self.pairs[self.to_play]:
-            if self.pairs[self.to_play] != cell:
-                self.recompute_groups()
-                self.compute_bridges()
-            else:
-                self.clear_bridge(self.lastmove, self.to_play)
-        else:
-            self.update_bridges(cell)
-            self.lastmove = cell
+            # the intrusion at lastmove went unanswered (an answer at the other
+            # carrier clears the pair above), so only that bridge is broken
+            self.clear_bridge(self.lastmove, self.to_play)
+            self.regroup(self.to_play, self.board.ravel().tolist())
+            self.winner = self.connected_player()
+        self.update_bridges(cell)
+        self.lastmove = cell
+        if self.groups[self.to_play].flags_of(index(*cell)) == GameMeta.CONNECTED:
+            self.winner = self.to_play
 
         self.to_play = 3 - self.to_play
+
+
+class FlatBridgeState(FlatGameState):
+    """
+    BridgeState counterpart for FlatGameState: same bridge bookkeeping, with
+    cells, carriers and edge nodes taken from the shared BoardTables.
+
+    """
+    def __init__(self, state: FlatGameState):
+        self.size = state.size
+        self.tables = state.tables
+        self.to_play = state.to_play
+        self.board = list(state.board)
+        self.empty_cells = list(state.empty_cells)
+        self.empty_index = list(state.empty_index)
+        white_groups = state.groups[GameMeta.PLAYERS['white']].clone()
+        black_groups = state.groups[GameMeta.PLAYERS['black']].clone()
+        self.groups = {
+            GameMeta.PLAYERS['white']: white_groups,
+            GameMeta.PLAYERS['black']: black_groups,
+        }
+        self.pairs = {
+            GameMeta.PLAYERS['white']: {},
+            GameMeta.PLAYERS['black']: {},
+        }
+        self.links = {
+            GameMeta.PLAYERS['white']: {},
+            GameMeta.PLAYERS['black']: {},
+        }
+        self.compute_bridges()
+        self.lastmove = None
+        self.white_played = state.white_played
+        self.black_played = state.black_played
+        self._hash = state.hash
+        self.winner = self.connected_player()
+
+    def compute_bridges(self):
+        self.pairs = {
+            GameMeta.PLAYERS['white']: {},
+            GameMeta.PLAYERS['black']: {},
+        }
+        self.links = {
+            GameMeta.PLAYERS['white']: {},
+            GameMeta.PLAYERS['black']: {},
+        }
+        shuffled_i = list(range(self.size))
+        shuffled_j = list(range(self.size))
+        random.shuffle(shuffled_i)
+        random.shuffle(shuffled_j)
+        for i in shuffled_i:
+            for j in shuffled_j:
+                cell = self.tables.index(i, j)
+                if self.board[cell] != GameMeta.PLAYERS["none"]:
+                    self.update_bridges(cell)
+
+    def update_bridges(self, cell):
+        board = self.board
+        player = board[cell]
+        pairs = self.pairs[player]
+
+        carriers = self.tables.carriers[player][cell]
+        for i in choice(GameMeta.BRIDGE_ORDERS[len(carriers)]):
+            c, m1, m2 = carriers[i]
+            if not (board[m1] == board[m2] == GameMeta.PLAYERS["none"]):
+                continue
+
+            if c < self.tables.cells and board[c] != player:
+                continue
+
+            if m1 in pairs or m2 in pairs:
+                continue
+
+            if self.groups[player].join(cell, c):
+                self.set_bridge(m1, m2, player, (cell, c))
+
+    copy_from = BridgeState.copy_from
+    regroup = BridgeState.regroup
+    clear_bridge = BridgeState.clear_bridge
+    set_bridge = BridgeState.set_bridge
+    get_bridge = BridgeState.get_bridge
+
+    connected_player = BridgeState.connected_player
+    bridge_winner = BridgeState.bridge_winner
+
+    def play(self, cell: int) -> None:
+        player = self.to_play
+        if self.board[cell] != GameMeta.PLAYERS['none']:
+            raise ValueError("Cell occupied")
+
+        if cell in self.pairs[player]:
+            self.clear_bridge(cell, player)
+
+        super().play(cell)
+
+        if self.lastmove in self.pairs[player]:
+            self.clear_bridge(self.lastmove, player)
+            self.regroup(player, self.board)
+            # play() above may have counted the broken bridge as a connection
+            self.winner = self.connected_player()
+        self.update_bridges(cell)
+        self.lastmove = cell
+        if self.groups[player].flags_of(cell) == GameMeta.CONNECTED:
+            self.winner = player
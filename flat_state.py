@@ -0,0 +1,149 @@
+from math import isqrt
+import numpy as np
+from game import GameState, GameMeta, BoardTables
+from union import ArrayUnionFind
+
+class FlatGameState(GameState):
+    """
+    GameState backend addressing cells by flat index (x * size + y) on a
+    plain list board. Moves are ints; neighbor, bridge and edge lookups come
+    from the BoardTables shared by every state of the same size.
+
+    """
+    def __init__(self, size):
+        self.size = size
+        self.tables = BoardTables.get(size)
+        self.to_play = GameMeta.PLAYERS['white']
+        self.board = [GameMeta.PLAYERS['none']] * self.tables.cells
+        self.white_played = 0
+        self.black_played = 0
+        self._hash = 0
+        self.empty_cells = list(range(self.tables.cells))
+        self.empty_index = list(range(self.tables.cells))
+        white_groups = ArrayUnionFind(self.tables.cells + 2)
+        black_groups = ArrayUnionFind(self.tables.cells + 2)
+        white_groups.set_ignored_elements([self.tables.edge1, self.tables.edge2])
+        black_groups.set_ignored_elements([self.tables.edge1, self.tables.edge2])
+        white_groups.set_flags(self.tables.edge_flags)
+        black_groups.set_flags(self.tables.edge_flags)
+
+        self.groups = {
+            GameMeta.PLAYERS['white']: white_groups,
+            GameMeta.PLAYERS['black']: black_groups,
+        }
+        self.winner = GameMeta.PLAYERS['none']
+
+    def play(self, cell: int) -> None:
+        board = self.board
+        if board[cell] != GameMeta.PLAYERS['none']:
+            raise ValueError("Cell occupied")
+
+        player = self.to_play
+        board[cell] = player
+        self.remove_empty(cell)
+        if player == GameMeta.PLAYERS['white']:
+            self.white_played += 1
+        else:
+            self.black_played += 1
+
+        self._hash ^= self.tables.zobrist[player][cell] ^ self.tables.zobrist_turn
+        groups = self.groups[player]
+        edge = self.tables.edges[player][cell]
+        if edge & GameMeta.EDGE1:
+            groups.join(self.tables.edge1, cell)
+        if edge & GameMeta.EDGE2:
+            groups.join(self.tables.edge2, cell)
+
+        for n in self.tables.neighbors[cell]:
+            if board[n] == player:
+                groups.join(n, cell)
+        if groups.flags_of(cell) == GameMeta.CONNECTED:
+            self.winner = player
+
+        self.to_play = 3 - player
+
+    @classmethod
+    def decode(cls, data: bytes) -> 'FlatGameState':
+        """Rebuild a state, groups included, from GameState.encode()."""
+        state = cls(isqrt(len(data) - 1))
+        for cell, owner in enumerate(data[1:]):
+            if owner != GameMeta.PLAYERS['none']:
+                state.set_turn(owner)
+                state.play(cell)
+        state.set_turn(data[0])
+        return state
+
+    def encode(self) -> bytes:
+        return bytes([self.to_play]) + bytes(self.board)
+
+    def copy_from(self, state: 'FlatGameState') -> None:
+        self.to_play = state.to_play
+        self.board[:] = state.board
+        self.empty_cells[:] = state.empty_cells
+        self.empty_index[:] = state.empty_index
+        self.white_played = state.white_played
+        self.black_played = state.black_played
+        self._hash = state._hash
+        self.winner = state.winner
+        for player, groups in self.groups.items():
+            groups.copy_from(state.groups[player])
+
+    def fill(self, cells: list) -> int:
+        board = self.board
+        player = self.to_play
+        self.remove_filled(cells)
+        h = self._hash
+        key = self.tables.zobrist[player]
+        for cell in cells[::2]:
+            board[cell] = player
+            h ^= key[cell]
+        key = self.tables.zobrist[3 - player]
+        for cell in cells[1::2]:
+            board[cell] = 3 - player
+            h ^= key[cell]
+        self._hash = h if len(cells) % 2 == 0 else h ^ self.tables.zobrist_turn
+        self.white_played += (len(cells) + (player == GameMeta.PLAYERS['white'])) // 2
+        self.black_played += (len(cells) + (player == GameMeta.PLAYERS['black'])) // 2
+        self.to_play = player if len(cells) % 2 == 0 else 3 - player
+        self.winner = self.filled_winner()
+        return self.winner
+
+    def filled_winner(self) -> int:
+        return self.tables.filled_winner(self.board)
+
+    def would_win(self, cell: int, color: int) -> bool:
+        groups = self.groups[color]
+        flags = self.tables.edges[color][cell]
+        for n in self.tables.neighbors[cell]:
+            if self.board[n] == color:
+                flags |= groups.flags_of(n)
+        return flags == GameMeta.CONNECTED
+
+    def neighbors(self, cell: int) -> tuple:
+        return self.tables.neighbors[cell]
+
+    def bridge_neighbors(self, cell: int) -> tuple:
+        return self.tables.bridges[cell]
+
+    def moves(self) -> list:
+        return list(self.empty_cells)
+
+    def stone_masks(self) -> dict:
+        board = np.frombuffer(bytes(self.board), dtype=np.uint8)
+        return {color: board == color
+                for color in (GameMeta.PLAYERS['white'], GameMeta.PLAYERS['black'])}
+
+    def owner(self, x: int, y: int) -> int:
+        return self.board[self.tables.index(x, y)]
+
+    def move_at(self, index: int) -> int:
+        return index
+
+    def cell_of(self, move: int) -> int:
+        return move
+
+    def action_to_str(self, move):
+        return super().action_to_str(self.tables.coords[move])
+
+    def str_to_action(self, s):
+        return self.tables.index(*super().str_to_action(s))
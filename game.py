@@ -1,14 +1,7 @@
+from itertools import permutations
+from random import Random, choice
 from numpy import zeros, int_
-from union import UnionFind
-
-SWAP_MATRIX = zeros((11, 11))
-SWAP_MATRIX[0, -1] = 1
-SWAP_MATRIX[1, -2:] = 1
-SWAP_MATRIX[2, 1:-1] = 1
-SWAP_MATRIX[3:8, :] = 1
-SWAP_MATRIX[8, 1:-1] = 1
-SWAP_MATRIX[9, 0:2] = 1
-SWAP_MATRIX[10, 0] = 1
+from union import ArrayUnionFind
 
 class GameMeta:
     PLAYERS = {'none': 0, 'white': 1, 'black': 2}
@@ -16,27 +9,224 @@ class GameMeta:
     GAME_OVER = -1
     EDGE1 = 1
     EDGE2 = 2
+    # flags of a group touching both of its player's edges
+    CONNECTED = EDGE1 | EDGE2
     NEIGHBOR_PATTERNS = ((-1, 0), (0, -1), (-1, 1), (0, 1), (1, 0), (1, -1))
     BRIDGE_PATTERNS = ((-1, -1), (1, -2), (2, -1), (1, 1), (-1, 2), (-2, 1))
-    SWAP_MATRIX = SWAP_MATRIX
+    BRIDGE_CARRIERS = (((-1, -1), ((-1, 0), (0, -1))),
+                       ((-2, 1), ((-1, 0), (-1, 1))),
+                       ((-1, 2), ((-1, 1), (0, 1))),
+                       ((1, 1), ((1, 0), (0, 1))),
+                       ((2, -1), ((1, 0), (1, -1))),
+                       ((1, -2), ((1, -1), (0, -1))))
+    # board size of agents created without a starting state
+    DEFAULT_SIZE = 11
+    # every visiting order of k bridge templates, to shuffle with one random choice
+    BRIDGE_ORDERS = tuple(tuple(permutations(range(k))) for k in range(len(BRIDGE_CARRIERS) + 1))
+
+
+class BoardTables:
+    """
+    Neighbor, bridge and edge lookups for one board size, indexed by flat
+    cell number (x * size + y). Built once per size and shared by every
+    state of that size, so they are never copied along with a state.
+
+    """
+    _cache = {}
+
+    def __init__(self, size: int):
+        self.size = size
+        self.cells = size * size
+        # virtual nodes standing for the two edges of the player to connect
+        self.edge1 = self.cells
+        self.edge2 = self.cells + 1
+        # union-find flags of the edge nodes, see ArrayUnionFind.set_flags
+        self.edge_flags = {self.edge1: GameMeta.EDGE1, self.edge2: GameMeta.EDGE2}
+        self.coords = tuple((x, y) for x in range(size) for y in range(size))
+
+        self.neighbors = tuple(self._offsets(cell, GameMeta.NEIGHBOR_PATTERNS)
+                               for cell in self.coords)
+        self.bridges = tuple(self._offsets(cell, GameMeta.BRIDGE_PATTERNS)
+                             for cell in self.coords)
+        # the same as (x, y) moves, for the tuple-addressed GameState
+        self.neighbor_coords = tuple(tuple(self.coords[n] for n in cells) for cells in self.neighbors)
+        self.bridge_coords = tuple(tuple(self.coords[b] for b in cells) for cells in self.bridges)
+        # opening moves worth swapping: all but the corner-most cells of the
+        # edge rows, generalising the 11x11 swap map to any size
+        self.swap = tuple(self._swappable(x, y) for x, y in self.coords)
+
+        # EDGE1 / EDGE2 bit flags of the edges each cell touches, per player
+        self.edges = {}
+        self.first_edge = {}
+        self.carriers = {}
+        for player in (GameMeta.PLAYERS['white'], GameMeta.PLAYERS['black']):
+            rc = int(player == GameMeta.PLAYERS['black'])
+            self.edges[player] = tuple(
+                GameMeta.EDGE1 * (cell[rc] == 0) | GameMeta.EDGE2 * (cell[rc] == size - 1)
+                for cell in self.coords)
+            self.first_edge[player] = tuple(
+                cell for cell, edge in enumerate(self.edges[player]) if edge & GameMeta.EDGE1)
+            self.carriers[player] = tuple(self._carriers(cell, rc) for cell in self.coords)
+
+        # bitboards: bit i of an int stands for flat cell i. Masks of every
+        # cell, of the cells with a neighbor column before / after them, and
+        # of each player's two edges, for shift-based neighborhoods
+        self.full = (1 << self.cells) - 1
+        self.not_first = sum(1 << cell for cell, (x, y) in enumerate(self.coords) if y > 0)
+        self.not_last = sum(1 << cell for cell, (x, y) in enumerate(self.coords) if y < size - 1)
+        self.edge_bits = {player: tuple(sum(1 << cell for cell, edge in enumerate(self.edges[player])
+                                            if edge & flag)
+                                        for flag in (GameMeta.EDGE1, GameMeta.EDGE2))
+                          for player in (GameMeta.PLAYERS['white'], GameMeta.PLAYERS['black'])}
+
+        # Zobrist keys per player and cell, plus one toggled with the side to
+        # move; seeded by size so every process hashes a position the same
+        rng = Random(size)
+        self.zobrist = {player: tuple(rng.getrandbits(64) for _ in range(self.cells))
+                        for player in (GameMeta.PLAYERS['white'], GameMeta.PLAYERS['black'])}
+        self.zobrist_turn = rng.getrandbits(64)
+
+    @classmethod
+    def get(cls, size: int) -> 'BoardTables':
+        if size not in cls._cache:
+            cls._cache[size] = cls(size)
+        return cls._cache[size]
+
+    def index(self, x: int, y: int) -> int:
+        return x * self.size + y
+
+    def connects(self, board, player: int) -> bool:
+        """
+        Whether the player's stones on a flat board sequence join its two
+        edges, found with a single flood fill from the first edge.
+
+        """
+        edges = self.edges[player]
+        neighbors = self.neighbors
+        stack = [cell for cell in self.first_edge[player] if board[cell] == player]
+        seen = set(stack)
+        while stack:
+            cell = stack.pop()
+            if edges[cell] & GameMeta.EDGE2:
+                return True
+            for n in neighbors[cell]:
+                if board[n] == player and n not in seen:
+                    seen.add(n)
+                    stack.append(n)
+        return False
+
+    def hash_of(self, board, to_play: int) -> int:
+        """Zobrist hash of a flat board sequence from scratch."""
+        h = self.zobrist_turn if to_play == GameMeta.PLAYERS['black'] else 0
+        for cell, owner in enumerate(board):
+            if owner != GameMeta.PLAYERS['none']:
+                h ^= self.zobrist[owner][cell]
+        return h
+
+    def grow(self, bits: int) -> int:
+        """The cells of bits together with all their neighbors, as a bitboard."""
+        size = self.size
+        right = bits & self.not_last
+        left = bits & self.not_first
+        return (bits | bits << size | bits >> size | right << 1 | left >> 1
+                | left << (size - 1) | right >> (size - 1)) & self.full
+
+    def connects_bits(self, stones: int, player: int) -> bool:
+        """connects() for a bitboard of the player's stones, one shift flood fill."""
+        first, second = self.edge_bits[player]
+        reach = stones & first
+        while not reach & second:
+            grown = self.grow(reach) & stones
+            if grown == reach:
+                return False
+            reach = grown
+        return True
+
+    def filled_winner(self, board) -> int:
+        # a full Hex board always has exactly one winner
+        if self.connects(board, GameMeta.PLAYERS['white']):
+            return GameMeta.PLAYERS['white']
+        return GameMeta.PLAYERS['black']
+
+    def _swappable(self, x: int, y: int) -> bool:
+        last = self.size - 1
+        # the map is symmetric through the centre of the board
+        if x > last - x:
+            x, y = last - x, last - y
+        if x == 0:
+            return y == last
+        if x == 1:
+            return y >= last - 1
+        if x == 2:
+            return 0 < y < last
+        return True
+
+    def _inside(self, x: int, y: int) -> bool:
+        return 0 <= x < self.size and 0 <= y < self.size
+
+    def _offsets(self, cell: tuple, patterns: tuple) -> tuple:
+        x, y = cell
+        return tuple(self.index(x + dx, y + dy) for dx, dy in patterns
+                     if self._inside(x + dx, y + dy))
+
+    def _carriers(self, cell: tuple, rc: int) -> tuple:
+        """
+        (target, carrier1, carrier2) for every bridge template of a cell. The
+        target is an edge node when the bridge hangs off the board edge.
+
+        """
+        x, y = cell
+        carriers = []
+        for (bx, by), ((ax1, ay1), (ax2, ay2)) in GameMeta.BRIDGE_CARRIERS:
+            m1 = (x + ax1, y + ay1)
+            m2 = (x + ax2, y + ay2)
+            if not (self._inside(*m1) and self._inside(*m2)):
+                continue
+
+            c = (x + bx, y + by)
+            if self._inside(*c):
+                target = self.index(*c)
+            elif c[rc] == -1:
+                target = self.edge1
+            elif c[rc] == self.size:
+                target = self.edge2
+            else:
+                continue
+            carriers.append((target, self.index(*m1), self.index(*m2)))
+        return tuple(carriers)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
 class GameState:
     def __init__(self, size):
         self.size = size
+        self.tables = BoardTables.get(size)
         self.to_play = GameMeta.PLAYERS['white']
         self.board = zeros((size, size))
         self.board = int_(self.board)
         self.white_played = 0
         self.black_played = 0
-        white_groups = UnionFind()
-        black_groups = UnionFind()
-        white_groups.set_ignored_elements([GameMeta.EDGE1, GameMeta.EDGE2])
-        black_groups.set_ignored_elements([GameMeta.EDGE1, GameMeta.EDGE2])
+        self._hash = 0
+        # empty flat cells in no particular order, and each cell's position
+        # in that list (-1 once occupied), for O(1) removal and random draws
+        self.empty_cells = list(range(self.tables.cells))
+        self.empty_index = list(range(self.tables.cells))
+        white_groups = ArrayUnionFind(self.tables.cells + 2)
+        black_groups = ArrayUnionFind(self.tables.cells + 2)
+        white_groups.set_ignored_elements([self.tables.edge1, self.tables.edge2])
+        black_groups.set_ignored_elements([self.tables.edge1, self.tables.edge2])
+        white_groups.set_flags(self.tables.edge_flags)
+        black_groups.set_flags(self.tables.edge_flags)
 
         self.groups = {
             GameMeta.PLAYERS['white']: white_groups,
             GameMeta.PLAYERS['black']: black_groups,
         }
+        self.winner = GameMeta.PLAYERS['none']
 
         self.bridges = {
             GameMeta.PLAYERS['white']: set(),
@@ -52,15 +242,20 @@ class GameState:
         self.white_played += self.to_play == GameMeta.PLAYERS['white']
         self.black_played += self.to_play == GameMeta.PLAYERS['black']
 
+        index = self.tables.index
+        self.remove_empty(index(*cell))
+        self._hash ^= self.tables.zobrist[self.to_play][index(*cell)] ^ self.tables.zobrist_turn
         rc = int(self.to_play == GameMeta.PLAYERS['black'])
         if cell[rc] == 0:
-            self.groups[self.to_play].join(GameMeta.EDGE1, cell)
+            self.groups[self.to_play].join(self.tables.edge1, index(*cell))
         if cell[rc] == self.size - 1:
-            self.groups[self.to_play].join(GameMeta.EDGE2, cell)
+            self.groups[self.to_play].join(self.tables.edge2, index(*cell))
 
         for n in self.neighbors(cell):
             if self.board[n] == self.to_play:
-                self.groups[self.to_play].join(n, cell)
+                self.groups[self.to_play].join(index(*n), index(*cell))
+        if self.groups[self.to_play].flags_of(index(*cell)) == GameMeta.CONNECTED:
+            self.winner = self.to_play
 
         for b in self.bridge_neighbors(cell):
             if self.board[b] == GameMeta.PLAYERS['none']:
@@ -68,62 +263,140 @@ class GameState:
 
         self.to_play = 3 - self.to_play
 
+    def remove_empty(self, index: int) -> None:
+        """Take the flat cell index out of the empty cells by swap-remove."""
+        empty, position = self.empty_cells, self.empty_index
+        last = empty.pop()
+        if last != index:
+            empty[position[index]] = last
+            position[last] = position[index]
+        position[index] = -1
+
+    def remove_filled(self, indices: list) -> None:
+        """Take many flat cells out of the empty cells in one pass."""
+        position = self.empty_index
+        for index in indices:
+            position[index] = -1
+        empty = self.empty_cells
+        empty[:] = [index for index in empty if position[index] >= 0]
+        for i, index in enumerate(empty):
+            position[index] = i
+
+    def random_move(self):
+        """A uniformly random empty cell, drawn in O(1)."""
+        return self.move_at(choice(self.empty_cells))
+
+    def copy_from(self, state: 'GameState') -> None:
+        """
+        Overwrite this state in place with another state of the same size,
+        reusing the board and union-find buffers.
+
+        """
+        self.to_play = state.to_play
+        self.board[:] = state.board
+        self.empty_cells[:] = state.empty_cells
+        self.empty_index[:] = state.empty_index
+        self.white_played = state.white_played
+        self.black_played = state.black_played
+        self._hash = state._hash
+        self.winner = state.winner
+        for player, groups in self.groups.items():
+            groups.copy_from(state.groups[player])
+        for player, bridges in self.bridges.items():
+            bridges.clear()
+            bridges.update(state.bridges[player])
+
+    def fill(self, cells: list) -> int:
+        """
+        Fill the given empty cells with alternating stones, starting with the
+        player to move, and return the winner. Groups are not updated, so
+        this is only meant for throwaway rollout states.
+
+        """
+        if cells:
+            player = self.to_play
+            xs, ys = zip(*cells)
+            self.board[xs[::2], ys[::2]] = player
+            self.board[xs[1::2], ys[1::2]] = 3 - player
+            index = self.tables.index
+            self.remove_filled([index(*cell) for cell in cells])
+            mine, theirs = self.tables.zobrist[player], self.tables.zobrist[3 - player]
+            for cell in cells[::2]:
+                self._hash ^= mine[index(*cell)]
+            for cell in cells[1::2]:
+                self._hash ^= theirs[index(*cell)]
+            if len(cells) % 2:
+                self._hash ^= self.tables.zobrist_turn
+            self.white_played += (len(cells) + (player == GameMeta.PLAYERS['white'])) // 2
+            self.black_played += (len(cells) + (player == GameMeta.PLAYERS['black'])) // 2
+            self.to_play = player if len(cells) % 2 == 0 else 3 - player
+        self.winner = self.filled_winner()
+        return self.winner
+
+    def filled_winner(self) -> int:
+        """Winner of the board once fill() has left no empty cell."""
+        return self.tables.filled_winner(self.board.ravel().tolist())
+
+    def encode(self) -> bytes:
+        """Compact position: the player to move followed by the flat board."""
+        return bytes([self.to_play]) + bytes(self.board.ravel().tolist())
+
     def get_num_played(self) -> dict:
         return {'white': self.white_played, 'black': self.black_played}
 
     def would_win(self, cell: tuple, color: int) -> bool:
-        connect1 = False
-        connect2 = False
-        rc = int(self.to_play == GameMeta.PLAYERS['black'])
-
-        if cell[rc] == 0:
-            connect1 = True
-        elif cell[rc] == self.size - 1:
-            connect2 = True
+        """Whether a stone of color at cell would join both of its edges."""
+        groups = self.groups[color]
+        flags = self.tables.edges[color][self.tables.index(*cell)]
         for n in self.neighbors(cell):
-            if self.groups[color].connected(GameMeta.EDGE1, n):
-                connect1 = True
-            elif self.groups[color].connected(GameMeta.EDGE2, n):
-                connect2 = True
-
-        return connect1 and connect2
+            if self.board[n] == color:
+                flags |= groups.flags_of(self.tables.index(*n))
+        return flags == GameMeta.CONNECTED
 
     def turn(self) -> int:
         return self.to_play
 
     def set_turn(self, player: int) -> None:
         if player in GameMeta.PLAYERS.values() and player != GameMeta.PLAYERS['none']:
+            if player != self.to_play:
+                self._hash ^= self.tables.zobrist_turn
             self.to_play = player
         else:
             raise ValueError('Invalid turn: ' + str(player))
 
     @property
-    def winner(self) -> int:
-        if self.groups[GameMeta.PLAYERS['white']].connected(GameMeta.EDGE1, GameMeta.EDGE2):
-            return GameMeta.PLAYERS['white']
-        if self.groups[GameMeta.PLAYERS['black']].connected(GameMeta.EDGE1, GameMeta.EDGE2):
-            return GameMeta.PLAYERS['black']
-        return GameMeta.PLAYERS['none']
+    def hash(self) -> int:
+        """64-bit Zobrist hash of the stones and the side to move."""
+        return self._hash
 
-    def neighbors(self, cell: tuple) -> list:
-        x, y = cell
-
-        return [(n[0] + x, n[1] + y) for n in GameMeta.NEIGHBOR_PATTERNS
-                if (0 <= n[0] + x < self.size and 0 <= n[1] + y < self.size)]
+    def hash_after(self, move) -> int:
+        """Hash of the position after the player to move plays move."""
+        return self._hash ^ self.tables.zobrist[self.to_play][self.cell_of(move)] ^ self.tables.zobrist_turn
 
-    def bridge_neighbors(self, cell: tuple) -> list:
-        x, y = cell
+    def neighbors(self, cell: tuple) -> tuple:
+        return self.tables.neighbor_coords[self.tables.index(*cell)]
 
-        return [(n[0] + x, n[1] + y) for n in GameMeta.BRIDGE_PATTERNS
-                if (0 <= n[0] + x < self.size and 0 <= n[1] + y < self.size)]
+    def bridge_neighbors(self, cell: tuple) -> tuple:
+        return self.tables.bridge_coords[self.tables.index(*cell)]
 
     def moves(self) -> list:
-        moves = []
-        for y in range(self.size):
-            for x in range(self.size):
-                if self.board[x, y] == GameMeta.PLAYERS['none']:
-                    moves.append((x, y))
-        return moves
+        coords = self.tables.coords
+        return [coords[index] for index in self.empty_cells]
+
+    def stone_masks(self) -> dict:
+        """Per player, a boolean array over the flat cells marking its stones."""
+        board = self.board.ravel()
+        return {color: board == color
+                for color in (GameMeta.PLAYERS['white'], GameMeta.PLAYERS['black'])}
+
+    def owner(self, x: int, y: int) -> int:
+        return self.board[x, y]
+
+    def move_at(self, index: int) -> tuple:
+        return self.tables.coords[index]
+
+    def cell_of(self, move: tuple) -> int:
+        return self.tables.index(*move)
 
     def __str__(self):
         white = 'W'
@@ -139,9 +412,9 @@ class GameState:
         for y in range(self.size):
             ret += str(y + 1) + ' ' * (offset * 2 + coord_size - len(str(y + 1)))
             for x in range(self.size):
-                if self.board[x, y] == GameMeta.PLAYERS['white']:
+                if self.owner(x, y) == GameMeta.PLAYERS['white']:
                     ret += white
-                elif self.board[x, y] == GameMeta.PLAYERS['black']:
+                elif self.owner(x, y) == GameMeta.PLAYERS['black']:
                     ret += black
                 else:
                     ret += empty
@@ -156,5 +429,5 @@ class GameState:
 
     def str_to_action(self, s):
         r = ord(s[0]) - 65
-        c = int(s[1]) - 1
+        c = int(s[1:]) - 1
         return (r, c)
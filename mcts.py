@@ -1,9 +1,14 @@
 from math import sqrt, log
 from copy import deepcopy
-from queue import Queue
-from random import choice
+from heapq import nlargest
+from random import choice, randrange
+from sys import getsizeof
 from time import time as clock
+import numpy as np
 from game import GameState, GameMeta
+from rollouts import ROLLOUTS
+from selection import pick
+from transposition import TranspositionTable
 
 class MCTS_ARGS:
     EXPLORATION = 0.7
@@ -14,6 +19,12 @@ class MCTS_ARGS:
     K_CONST = 10
     A_CONST = 0.25
     WARMUP_ROLLOUTS = 7
+    TT_CAPACITY = 1 << 16
+    STOP_CHECK = 32
+    # on reaching the node budget, collapse subtrees under this many visits,
+    # doubling it until the tree is back to PRUNE_TARGET of the budget
+    PRUNE_VISITS = 8
+    PRUNE_TARGET = 0.75
 
 class Node:
     def __init__(self, move: tuple = None, parent: object = None):
@@ -22,29 +33,98 @@ class Node:
         self.N = 0  # times this position was visited
         self.Q = 0  # average reward (wins-losses) from this position
         self.children = {}
+        self.size = 1  # nodes in the subtree below and including this one
         self.outcome = GameMeta.PLAYERS['none']
 
     def add_children(self, children: dict) -> None:
         for child in children:
             self.children[child.move] = child
 
+    def collapse(self) -> None:
+        """Drop what the node holds for its children once prune() discarded them."""
+
+    def relink(self, parent: 'Node', index: int) -> None:
+        """
+        Point a node shared through the transposition table at the parent
+        and move it is being reached through, so backup follows this path.
+
+        """
+        self.parent = parent
+        self.move = list(parent.children)[index]
+
     @property
     def value(self, explore: float = MCTS_ARGS.EXPLORATION):
         pass
 
+    @classmethod
+    def scores(cls, children: list, parent: 'Node', ref: 'Node' = None) -> np.ndarray:
+        """
+        Selection value of every child of parent. Node types override this
+        with a single vectorized pass over the children's statistics; ref
+        is the GRAVE reference node, ignored by the other node types.
+
+        """
+        return np.array([child.value for child in children], dtype=float)
+
 class MCTS:
-    def __init__(self, state=GameState(11)):
+    def __init__(self, state: GameState = None, rollout: str = None, transpositions: int = None,
+                 node_budget: int = None, memory_budget: int = None):
+        """
+        state is the starting position, by default an empty board of
+        GameMeta.DEFAULT_SIZE; any size works, its BoardTables are built on
+        first use and shared by every game of that size.
+
+        rollout selects one of the engines in rollouts.ROLLOUTS instead of
+        the agent's own roll_out, e.g. "fill", or is a rollout callable
+        such as parallel.LeafParallelRollout.
+
+        transpositions is the capacity of a TranspositionTable through which
+        every move order reaching a position shares one node; by default
+        the search grows a plain tree.
+
+        node_budget and memory_budget (bytes) bound the tree. When the
+        limit is reached, low-visit subtrees are pruned, and if that is not
+        enough the search stops expanding until the next move.
+
+        """
+        if state is None:
+            state = GameState(GameMeta.DEFAULT_SIZE)
+        if isinstance(rollout, str):
+            self.roll_out = ROLLOUTS[rollout]
+        elif rollout is not None:
+            self.roll_out = rollout
         self.root_state = deepcopy(state)
+        self.scratch_state = deepcopy(state)
         self.root = Node()
+        self.transpositions = TranspositionTable(transpositions) if transpositions else None
+        self.node_budget = node_budget
+        self.memory_budget = memory_budget
+        self.node_limit = None
+        self.expanding = True
+        self.counted_root = self.root
+        self.max_depth = 0
+        self.expansions = 0
+        self.expanded_children = 0
         self.run_time = 0
         self.node_count = 0
+        self.node_size = 0
         self.num_rollouts = 0
+        self.update_limit()
 
 
     @staticmethod
     def expand(parent: Node, state: GameState) -> bool:
         pass
 
+    def widen(self, node: Node, state: GameState) -> list:
+        """
+        Materialise more children of the expanded node, reached in state,
+        as its visits grow. Returns the moves of the new children; agents
+        that expand every child at once add none.
+
+        """
+        return []
+
     @staticmethod
     def roll_out(state: GameState) -> int:
         pass
@@ -56,43 +136,106 @@ class MCTS:
     def move(self, move: tuple) -> None:
         pass
 
-    def search(self, time_budget: int) -> None:
+    def search(self, time_budget: int, until=None) -> None:
+        """
+        Search for at most time_budget seconds. until(agent, elapsed,
+        rollouts), e.g. TimeManager.should_stop, is polled every STOP_CHECK
+        simulations and ends the search early when it returns True.
+
+        """
         start_time = clock()
-        num_rollouts = 0
+        start_visits = self.root_visits()
+        if self.transpositions is not None:
+            self.transpositions.reset_statistics()
+        self.max_depth = 0
+        self.expansions = 0
+        self.expanded_children = 0
 
+        simulations = 0
         while clock() - start_time < time_budget:
             node, state = self.select_node()
             turn = state.turn()
             self.backup(node, turn, *self.roll_out(state))
-            num_rollouts += 1
+            simulations += 1
+            if until is not None and simulations % MCTS_ARGS.STOP_CHECK == 0 \
+                    and until(self, clock() - start_time, self.root_visits() - start_visits):
+                break
+        # every playout is backed up through the root, batched ones included
+        num_rollouts = self.root_visits() - start_visits
         run_time = clock() - start_time
-        node_count = self.tree_size()
         self.run_time = run_time
-        self.node_count = node_count
+        self.node_count = self.tree_size()
+        self.node_size = self.node_bytes()
         self.num_rollouts = num_rollouts
 
+    def ponder(self, stop) -> None:
+        """
+        Keep searching from the current root until stop, a threading.Event,
+        is set; meant to run in a background thread on the opponent's time.
+        Join that thread before calling move() so the pondered subtree of
+        the opponent's reply is kept as the new root.
+
+        """
+        while not stop.is_set():
+            node, state = self.select_node()
+            turn = state.turn()
+            self.backup(node, turn, *self.roll_out(state))
+
     def select_node(self) -> tuple:
         """
         Select a node in the tree to preform a single simulation from.
+        The returned state is the agent's scratch state, restored from the
+        root state in place on every call, so it is only valid until the
+        next selection.
 
         """
+        if self.root is not self.counted_root:
+            self.root_changed()
+        if self.over_budget():
+            self.enforce_budget()
+
         node = self.root
-        state = deepcopy(self.root_state)
+        # per depth parity, the nearest node on the path with enough playouts
+        # to be a GRAVE reference; its AMAF is of the player to move there
+        refs = [None, None]
+        depth = 0
+        state = self.scratch_state
+        state.copy_from(self.root_state)
 
         while len(node.children) != 0:
-            children = node.children.values()
-            max_value = max(children, key=lambda n: n.value).value
-            max_nodes = [n for n in node.children.values()
-                         if n.value == max_value]
-            node = choice(max_nodes)
+            depth += 1
+            if node.N >= MCTS_ARGS.GRAVE_REF:
+                refs[depth % 2] = node
+            ref = refs[depth % 2]
+            if self.expanding:
+                moves = self.widen(node, state)
+                if moves:
+                    self.attach(node, state, moves)
+            children = list(node.children.values())
+            index = pick(children[0].scores(children, node, ref))
+            if self.transpositions is not None:
+                children[index].relink(node, index)
+            node = children[index]
             state.play(node.move)
 
             if node.N == 0:
+                self.max_depth = max(self.max_depth, depth)
                 return node, state
 
-        if self.expand(node, state):
-            node = choice(list(node.children.values()))
+        if self.expanding and self.expand(node, state):
+            self.attach(node, state)
+            children = list(node.children.values())
+            index = randrange(len(children))
+            if self.transpositions is not None:
+                children[index].relink(node, index)
+            self.expansions += 1
+            if node is self.root and self.memory_budget:
+                # node_bytes() needs the root's children to measure
+                self.update_limit()
+            node = children[index]
             state.play(node.move)
+            depth += 1
+        self.max_depth = max(self.max_depth, depth)
         return node, state
 
     def best_move(self) -> tuple:
@@ -100,24 +243,182 @@ class MCTS:
             return GameMeta.GAME_OVER
 
         max_value = max(self.root.children.values(), key=lambda n: n.N).N
-        max_nodes = [n for n in self.root.children.values() if n.N == max_value]
-        bestchild = choice(max_nodes)
-        return bestchild.move
+        max_moves = [move for move, n in self.root.children.items() if n.N == max_value]
+        return choice(max_moves)
 
     def set_gamestate(self, state: GameState) -> None:
+        self.release()
         self.root_state = deepcopy(state)
+        self.scratch_state = deepcopy(state)
         self.root = Node()
 
+    def root_changed(self) -> None:
+        """Start the budget over once move() or set_gamestate() replaced the root."""
+        self.counted_root = self.root
+        self.expanding = True
+        self.update_limit()
+
+    def attach(self, node: Node, state: GameState, moves: list = None) -> None:
+        """
+        Account for the children of node just added by expand or, given
+        their moves, by widen: link them through the transposition table
+        and grow the subtree sizes up to the root.
+
+        """
+        count = len(node.children) if moves is None else len(moves)
+        added = count
+        if self.transpositions is not None:
+            added -= self.transpositions.link(node, state, moves)
+        self.resize(node, added)
+        self.expanded_children += count
+
+    @staticmethod
+    def resize(node: Node, added: int) -> None:
+        """Add added nodes to the subtree sizes of node and its ancestors."""
+        while node is not None:
+            node.size += added
+            node = node.parent
+
+    def update_limit(self) -> None:
+        """Node limit from the node budget and the memory budget over node_bytes()."""
+        limits = [self.node_budget] if self.node_budget else []
+        if self.memory_budget:
+            limits.append(self.memory_budget // max(self.node_bytes(), 1))
+        self.node_limit = min(limits) if limits else None
+
+    def over_budget(self) -> bool:
+        """Whether the next selection prunes the tree, or stops it growing."""
+        return self.node_limit is not None and self.expanding and self.tree_size() >= self.node_limit
+
+    def enforce_budget(self) -> None:
+        """
+        Prune subtrees under a doubling visit threshold until the tree is
+        back to PRUNE_TARGET of the node limit, or stop expanding. Nodes
+        shared through transpositions cannot be pruned safely.
+
+        """
+        target = self.node_limit * MCTS_ARGS.PRUNE_TARGET
+        min_visits = MCTS_ARGS.PRUNE_VISITS
+        while self.transpositions is None and self.tree_size() > target and min_visits <= self.root_visits():
+            self.prune(min_visits)
+            min_visits *= 2
+        self.expanding = self.tree_size() < self.node_limit
+
+    def prune(self, min_visits: int) -> None:
+        """Turn every non-root node with fewer than min_visits visits back into a leaf."""
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            for child in node.children.values():
+                if not child.children:
+                    continue
+                if child.N < min_visits:
+                    self.resize(node, -self.discard(child))
+                    child.collapse()
+                    child.size = 1
+                else:
+                    stack.append(child)
+
+    @staticmethod
+    def discard(node: Node, keep: set = ()) -> int:
+        """
+        Free the subtree below node, except the nodes in keep, by breaking
+        the parent/child reference cycles so reference counting reclaims it
+        at once instead of the cyclic garbage collector much later.
+        Returns the number of nodes released.
+
+        """
+        released = 0
+        stack = list(node.children.values())
+        node.children = {}
+        while stack:
+            node = stack.pop()
+            if node in keep:
+                continue
+            released += 1
+            stack.extend(node.children.values())
+            node.children = {}
+            node.parent = None
+        return released
+
+    @staticmethod
+    def reachable(node: Node) -> set:
+        """
+        Nodes below and including node. Nodes shared through transpositions
+        are pointed at a parent among them, in case their last parent is
+        about to be discarded.
+
+        """
+        nodes = {node}
+        stack = [node]
+        while stack:
+            parent = stack.pop()
+            for move, child in parent.children.items():
+                if child not in nodes:
+                    child.parent = parent
+                    child.move = move
+                    nodes.add(child)
+                    stack.append(child)
+        return nodes
+
+    def release(self, child: Node = None) -> None:
+        """
+        Drop the old root and every subtree but child's, if kept, after a
+        move or a new game. With transpositions the nodes child cannot reach
+        are dropped from the table too, and its subtree is recounted, since
+        a node in it may have been created under another move.
+
+        """
+        if self.transpositions is None:
+            self.discard(self.root, {child})
+            return
+
+        kept = self.reachable(child) if child is not None else set()
+        self.transpositions.retain(kept)
+        self.discard(self.root, kept)
+        if child is not None:
+            child.size = len(kept)
+
+    def node_bytes(self) -> int:
+        """
+        Approximate memory per node: the node object itself, averaged over
+        the root's children, plus its share of the children dict and
+        statistics arrays its parent holds, measured at the root.
+
+        """
+        root = self.root
+        children = list(root.children.values()) or [root]
+        own = sum(getsizeof(node) + getsizeof(vars(node)) for node in children) / len(children)
+        shared = getsizeof(root.children) + sum(value.nbytes for value in vars(root).values()
+                                                if isinstance(value, np.ndarray))
+        return int(own + shared / max(len(root.children), 1))
+
+    def root_visits(self) -> int:
+        return self.root.N
+
+    def leading_visits(self) -> tuple:
+        """Visit counts of the two most visited root children."""
+        visits = nlargest(2, (child.N for child in self.root.children.values())) + [0, 0]
+        return visits[0], visits[1]
+
     def statistics(self) -> tuple:
-        return self.num_rollouts, self.node_count, self.run_time
+        return self.num_rollouts, self.node_count, self.run_time, self.node_size
+
+    def tree_statistics(self) -> tuple:
+        """Node count, and the deepest path and mean branching of the last search."""
+        branching = self.expanded_children / self.expansions if self.expansions else 0
+        return self.tree_size(), self.max_depth, branching
+
+    def transposition_statistics(self) -> tuple:
+        """Hit rate and rollouts carried in by linked nodes during the last search."""
+        if self.transpositions is None:
+            return 0, 0
+        return self.transpositions.hit_rate(), self.transpositions.saved
 
     def tree_size(self) -> int:
-        Q = Queue()
-        count = 0
-        Q.put(self.root)
-        while not Q.empty():
-            node = Q.get()
-            count += 1
-            for child in node.children.values():
-                Q.put(child)
-        return count
+        """
+        Nodes under the root, kept up to date on expansion, pruning and
+        re-rooting; with transpositions every shared node counts once.
+
+        """
+        return self.root.size
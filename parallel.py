@@ -0,0 +1,290 @@
+import os
+import random
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from copy import deepcopy
+from multiprocessing import Pipe, Pool, Process, cpu_count
+from time import time as clock
+
+import numpy as np
+
+from agents.grave import GRaveMctsAgent
+from flat_state import FlatGameState
+from game import GameState, GameMeta
+from rollouts import ROLLOUTS, RolloutBatch
+
+STAT_FIELDS = ('N', 'Q', 'N_RAVE', 'Q_RAVE')
+
+def root_statistics(agent) -> dict:
+    """{move: [N, Q, N_RAVE, Q_RAVE]} of the root children of an agent."""
+    return {move: [getattr(child, field, 0) for field in STAT_FIELDS]
+            for move, child in agent.root.children.items()}
+
+def _reseed() -> None:
+    # forked workers inherit the parent's generator state, reseed so their
+    # searches and playouts actually differ
+    random.seed(os.urandom(16))
+    np.random.seed(int.from_bytes(os.urandom(4), 'little'))
+
+def _worker(conn, agent_cls, state, kwargs) -> None:
+    _reseed()
+    agent = agent_cls(state, **kwargs)
+
+    while True:
+        command, arg = conn.recv()
+        if command == 'search':
+            agent.search(arg)
+            conn.send((root_statistics(agent), agent.statistics()))
+        elif command == 'move':
+            agent.move(arg)
+        elif command == 'set_gamestate':
+            agent.set_gamestate(arg)
+        elif command == 'close':
+            break
+    conn.close()
+
+
+class RootParallelAgent:
+    """
+    Root-parallel MCTS. Each worker process grows its own tree of agent_cls
+    from the same root state; after a search the N, Q, N_RAVE and Q_RAVE of
+    the root children are summed over workers and best_move picks from the
+    merged statistics. Workers are started once and kept in step with
+    move(), so a search only costs one message round trip per worker.
+
+    """
+    def __init__(self, agent_cls=GRaveMctsAgent, state: GameState = None, workers: int = None, **kwargs):
+        if state is None:
+            state = GameState(GameMeta.DEFAULT_SIZE)
+        self.root_state = deepcopy(state)
+        self.root_stats = {}
+        self.run_time = 0
+        self.node_count = 0
+        self.node_size = 0
+        self.num_rollouts = 0
+
+        self.connections = []
+        self.workers = []
+        for _ in range(workers or cpu_count()):
+            parent_conn, child_conn = Pipe()
+            worker = Process(target=_worker, args=(child_conn, agent_cls, state, kwargs), daemon=True)
+            worker.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.workers.append(worker)
+
+    def _broadcast(self, command: str, arg=None) -> None:
+        for conn in self.connections:
+            conn.send((command, arg))
+
+    def search(self, time_budget: int) -> None:
+        start_time = clock()
+        self._broadcast('search', time_budget)
+
+        self.root_stats = {}
+        self.num_rollouts = 0
+        self.node_count = 0
+        for conn in self.connections:
+            stats, (rollouts, nodes, _, node_size) = conn.recv()
+            self.num_rollouts += rollouts
+            self.node_count += nodes
+            self.node_size = node_size
+            for move, values in stats.items():
+                merged = self.root_stats.setdefault(move, [0] * len(STAT_FIELDS))
+                for i, value in enumerate(values):
+                    merged[i] += value
+        self.run_time = clock() - start_time
+
+    def best_move(self) -> tuple:
+        if self.root_state.winner != GameMeta.PLAYERS['none']:
+            return GameMeta.GAME_OVER
+
+        max_value = max(stats[0] for stats in self.root_stats.values())
+        max_moves = [move for move, stats in self.root_stats.items() if stats[0] == max_value]
+        return random.choice(max_moves)
+
+    def move(self, move: tuple) -> None:
+        self.root_state.play(move)
+        self.root_stats = {}
+        self._broadcast('move', move)
+
+    def set_gamestate(self, state: GameState) -> None:
+        self.root_state = deepcopy(state)
+        self.root_stats = {}
+        self._broadcast('set_gamestate', state)
+
+    def statistics(self) -> tuple:
+        return self.num_rollouts, self.node_count, self.run_time, self.node_size
+
+    def close(self) -> None:
+        self._broadcast('close')
+        for worker in self.workers:
+            worker.join()
+        for conn in self.connections:
+            conn.close()
+        self.connections = []
+        self.workers = []
+
+
+def _accumulate(wins: dict, totals: dict, part_wins: dict, part_amaf: dict) -> None:
+    for color in wins:
+        wins[color] += part_wins[color]
+        count, won = part_amaf[color]
+        total_count, total_won = totals[color]
+        total_count += count
+        total_won += won
+
+def _empty_totals(cells: int) -> tuple:
+    wins = {GameMeta.PLAYERS['white']: 0, GameMeta.PLAYERS['black']: 0}
+    totals = {color: (np.zeros(cells, dtype=np.int64), np.zeros(cells, dtype=np.int64))
+              for color in wins}
+    return wins, totals
+
+def _leaf_rollouts(data: bytes, playouts: int, engine: str) -> tuple:
+    """
+    Run playouts from an encoded position and return the win counts and
+    per-player AMAF (playouts, won) count arrays over the cells.
+
+    """
+    state = FlatGameState.decode(data)
+    scratch = FlatGameState(state.size)
+    roll_out = ROLLOUTS[engine]
+    wins, amaf = _empty_totals(state.tables.cells)
+
+    done = 0
+    while done < playouts:
+        scratch.copy_from(state)
+        outcome, rave_pts = roll_out(scratch)
+        batch = outcome if isinstance(outcome, RolloutBatch) else RolloutBatch.single(outcome, rave_pts)
+
+        done += batch.playouts
+        _accumulate(wins, amaf, batch.wins, batch.amaf)
+    return done, wins, amaf
+
+
+class LeafParallelRollout:
+    """
+    Leaf-parallel rollout engine: the selected leaf is encoded as bytes and
+    a process pool runs the playouts from it in parallel. The aggregated
+    result is a RolloutBatch, so RAVE/GRAVE agents back it up in one pass.
+    Pass an instance as the rollout argument of an agent.
+
+    """
+    def __init__(self, workers: int = None, playouts: int = 64, engine: str = "fill"):
+        self.workers = workers or cpu_count()
+        self.playouts = playouts
+        self.engine = engine
+        self.pool = Pool(self.workers, initializer=_reseed)
+
+    def __call__(self, state: GameState) -> tuple:
+        data = state.encode()
+        share, extra = divmod(self.playouts, self.workers)
+        tasks = [(data, share + (i < extra), self.engine)
+                 for i in range(self.workers) if share + (i < extra)]
+
+        playouts = 0
+        wins, totals = _empty_totals(state.tables.cells)
+        for done, part_wins, part_amaf in self.pool.starmap(_leaf_rollouts, tasks):
+            playouts += done
+            _accumulate(wins, totals, part_wins, part_amaf)
+
+        batch = RolloutBatch(playouts, wins, totals)
+        return batch, batch.amaf
+
+    def close(self) -> None:
+        self.pool.close()
+        self.pool.join()
+
+
+def free_threaded() -> bool:
+    return not getattr(sys, '_is_gil_enabled', lambda: True)()
+
+
+class PipelinedSearch:
+    """
+    Search driver keeping several simulations in flight. Every selected path
+    gets a virtual loss on N and Q so the next descents diverge, its leaf is
+    shipped to a thread or process pool, and results are backed up (and the
+    virtual loss removed) as they complete. Threads are the default on
+    free-threaded builds, processes otherwise. The virtual loss is taken
+    back along the path it was put on, and a tree over its budget is only
+    pruned once every simulation in flight is backed up, so no pending
+    leaf is cut off from the root.
+
+    """
+    def __init__(self, agent, workers: int = None, in_flight: int = None, executor: str = None,
+                 engine: str = "fill", virtual_loss: int = 1):
+        self.agent = agent
+        self.workers = workers or cpu_count()
+        self.in_flight = in_flight or 2 * self.workers
+        self.engine = engine
+        self.virtual_loss = virtual_loss
+        if executor is None:
+            executor = "thread" if free_threaded() else "process"
+        pool_cls = ThreadPoolExecutor if executor == "thread" else ProcessPoolExecutor
+        self.pool = pool_cls(self.workers, initializer=_reseed)
+
+        self.run_time = 0
+        self.num_rollouts = 0
+
+    @property
+    def root_state(self) -> GameState:
+        return self.agent.root_state
+
+    @staticmethod
+    def _path(node) -> list:
+        path = []
+        while node is not None:
+            path.append(node)
+            node = node.parent
+        return path
+
+    def _apply_virtual_loss(self, path: list, sign: int) -> None:
+        visits = sign * self.virtual_loss
+        for node in path:
+            node.N += visits
+            node.Q += visits * self.agent.LOSS_REWARD
+
+    def search(self, time_budget: int) -> None:
+        agent = self.agent
+        start_time = clock()
+        start_visits = agent.root.N
+        pending = {}
+
+        while True:
+            while clock() - start_time < time_budget and len(pending) < self.in_flight \
+                    and not (pending and agent.over_budget()):
+                node, state = agent.select_node()
+                path = self._path(node)
+                self._apply_virtual_loss(path, 1)
+                future = self.pool.submit(_leaf_rollouts, state.encode(), 1, self.engine)
+                pending[future] = (path, state.turn())
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, turn = pending.pop(future)
+                self._apply_virtual_loss(path, -1)
+                playouts, wins, totals = future.result()
+                batch = RolloutBatch(playouts, wins, totals)
+                agent.backup(path[0], turn, batch, batch.amaf)
+
+        self.run_time = clock() - start_time
+        self.num_rollouts = agent.root.N - start_visits
+
+    def best_move(self) -> tuple:
+        return self.agent.best_move()
+
+    def move(self, move: tuple) -> None:
+        self.agent.move(move)
+
+    def set_gamestate(self, state: GameState) -> None:
+        self.agent.set_gamestate(state)
+
+    def statistics(self) -> tuple:
+        return self.num_rollouts, self.agent.tree_size(), self.run_time, self.agent.node_bytes()
+
+    def close(self) -> None:
+        self.pool.shutdown()
@@ -0,0 +1,107 @@
+from random import shuffle
+import numpy as np
+from game import GameState, GameMeta
+
+BATCH_PLAYOUTS = 32
+
+def random_rollout(state: GameState) -> tuple:
+    while state.winner == GameMeta.PLAYERS["none"]:
+        state.play(state.random_move())
+
+    return state.winner, state.stone_masks()
+
+def fill_rollout(state: GameState) -> tuple:
+    """
+    Hex cannot end in a draw, so a uniformly random playout is decided by
+    filling every empty cell from one shuffled permutation and checking
+    connectivity once at the end. The AMAF points are all the stones of the
+    filled board.
+
+    """
+    moves = state.moves()
+    shuffle(moves)
+    return state.fill(moves), state.stone_masks()
+
+class RolloutBatch:
+    """
+    Aggregated result of many playouts from one position: the number of
+    playouts each player won and, per player, the AMAF statistics of every
+    cell as a pair of arrays over the flat cells, (playouts in which the
+    player held the cell, of those the playouts it won).
+
+    """
+    def __init__(self, playouts: int, wins: dict, amaf: dict):
+        self.playouts = playouts
+        self.wins = wins
+        self.amaf = amaf
+
+    @classmethod
+    def single(cls, outcome: int, masks: dict) -> 'RolloutBatch':
+        """Batch of one playout from its winner and per-player stone masks."""
+        return cls(1, {color: int(color == outcome) for color in masks},
+                   {color: (mask, mask if color == outcome else np.zeros_like(mask))
+                    for color, mask in masks.items()})
+
+
+def batch_winners(boards: np.ndarray) -> np.ndarray:
+    """
+    Winners of K full (K, size, size) boards at once. White's stones are
+    flood filled from its first edge by repeated dilation over the six hex
+    directions; a full board that white does not connect is black's.
+
+    """
+    k, size, _ = boards.shape
+    white = np.zeros((k, size + 2, size + 2), dtype=bool)
+    white[:, 1:-1, 1:-1] = boards == GameMeta.PLAYERS['white']
+    reach = np.zeros_like(white)
+    reach[:, 1, :] = white[:, 1, :]
+
+    while True:
+        grown = reach.copy()
+        inner = grown[:, 1:-1, 1:-1]
+        for dx, dy in GameMeta.NEIGHBOR_PATTERNS:
+            inner |= reach[:, 1 + dx:size + 1 + dx, 1 + dy:size + 1 + dy]
+        grown &= white
+        if np.array_equal(grown, reach):
+            break
+        reach = grown
+
+    return np.where(reach[:, size, :].any(axis=1),
+                    GameMeta.PLAYERS['white'], GameMeta.PLAYERS['black'])
+
+def batch_rollout(state: GameState, playouts: int = BATCH_PLAYOUTS) -> tuple:
+    """
+    Run many fill-the-board playouts from one position as a single
+    (playouts, size, size) array. Each playout gives the player to move a
+    uniformly random half (rounded up) of the empty cells, which is the
+    same distribution as alternating moves from a shuffled permutation.
+
+    """
+    size = state.size
+    player = state.turn()
+    board = np.asarray(state.board).reshape(size * size)
+    empty = np.flatnonzero(board == GameMeta.PLAYERS['none'])
+
+    boards = np.tile(board, (playouts, 1))
+    boards[:, empty] = 3 - player
+    order = np.random.random((playouts, empty.size)).argsort(axis=1)
+    mine = empty[order[:, :(empty.size + 1) // 2]]
+    boards[np.arange(playouts)[:, None], mine] = player
+
+    winners = batch_winners(boards.reshape(playouts, size, size))
+    wins = {}
+    amaf = {}
+    for color in (GameMeta.PLAYERS['white'], GameMeta.PLAYERS['black']):
+        held = boards == color
+        won = winners == color
+        wins[color] = int(won.sum())
+        amaf[color] = (held.sum(axis=0), held[won].sum(axis=0))
+
+    batch = RolloutBatch(playouts, wins, amaf)
+    return batch, batch.amaf
+
+ROLLOUTS = {
+    "random": random_rollout,
+    "fill": fill_rollout,
+    "batch": batch_rollout,
+}
@@ -0,0 +1,50 @@
+from math import log
+from operator import attrgetter
+from random import choice
+
+import numpy as np
+
+from game import GameMeta
+
+def uct_scores(N: np.ndarray, Q: np.ndarray, parent_N: float, explore: float) -> np.ndarray:
+    """UctNode.value of a whole row of siblings at once."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = Q / N + explore * np.sqrt(2 * log(max(parent_N, 1)) / N)
+    scores[N == 0] = 0 if explore == 0 else GameMeta.INF
+    return scores
+
+def rave_scores(N: np.ndarray, Q: np.ndarray, N_RAVE: np.ndarray, Q_RAVE: np.ndarray,
+                parent_N: float, explore: float, rave_const: float) -> np.ndarray:
+    """RaveNode.value of a whole row of siblings at once."""
+    alpha = np.maximum(0, (rave_const - N) / rave_const)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        AMAF = np.where(N_RAVE != 0, Q_RAVE / N_RAVE, 0)
+        scores = (1 - alpha) * uct_scores(N, Q, parent_N, explore) + alpha * AMAF
+    scores[N == 0] = 0 if explore == 0 else GameMeta.INF
+    return scores
+
+def grave_scores(N: np.ndarray, Q: np.ndarray, N_RAVE: np.ndarray, Q_RAVE: np.ndarray,
+                 parent_N: float, explore: float, rave_const: float, ref: float,
+                 ref_N_RAVE: np.ndarray = None, ref_Q_RAVE: np.ndarray = None) -> np.ndarray:
+    """
+    GRAVE value of a whole row of siblings at once. Children with fewer
+    than ref AMAF samples blend UCT with the AMAF statistics of the same
+    moves at the reference node (ref_N_RAVE / ref_Q_RAVE, their own when
+    no reference is given); the others are scored by UCT alone.
+
+    """
+    if ref_N_RAVE is None:
+        ref_N_RAVE, ref_Q_RAVE = N_RAVE, Q_RAVE
+    scores = rave_scores(N, Q, ref_N_RAVE, ref_Q_RAVE, parent_N, explore, rave_const)
+    settled = N_RAVE >= ref
+    scores[settled] = uct_scores(N[settled], Q[settled], parent_N, explore)
+    return scores
+
+def gather(children: list, *fields: str) -> np.ndarray:
+    """One row per field of the given statistics of a list of nodes."""
+    getter = attrgetter(*fields)
+    return np.array([getter(child) for child in children], dtype=float).T
+
+def pick(scores: np.ndarray) -> int:
+    """Index of a best score, ties broken uniformly at random."""
+    return choice(np.flatnonzero(scores == scores.max()))
@@ -0,0 +1,58 @@
+import random
+
+import numpy as np
+
+from agents.array_grave import ArrayGRaveMctsAgent
+from agents.grave import GRaveMctsAgent, GRaveNode
+from flat_state import FlatGameState
+from mcts import MCTS_ARGS
+
+SIMULATIONS = 1500
+
+
+def simulate(agent, simulations=SIMULATIONS):
+    for _ in range(simulations):
+        node, state = agent.select_node()
+        agent.backup(node, state.turn(), *agent.roll_out(state))
+
+
+def test_reference_has_same_player_to_move(monkeypatch):
+    monkeypatch.setattr(MCTS_ARGS, 'GRAVE_REF', 10)
+    random.seed(0)
+    np.random.seed(0)
+    distances = []
+    scores = GRaveNode.scores.__func__
+
+    def recording(cls, children, parent, ref=None):
+        if ref is not None:
+            above, distance = parent, 0
+            while above is not ref:
+                above, distance = above.parent, distance + 1
+            distances.append(distance)
+        return scores(cls, children, parent, ref)
+
+    monkeypatch.setattr(GRaveNode, 'scores', classmethod(recording))
+    simulate(GRaveMctsAgent(FlatGameState(5)))
+    assert any(distances)
+    assert all(distance % 2 == 0 for distance in distances)
+
+
+def test_array_reference_has_same_player_to_move(monkeypatch):
+    monkeypatch.setattr(MCTS_ARGS, 'GRAVE_REF', 10)
+    random.seed(0)
+    distances = []
+    agent = ArrayGRaveMctsAgent(FlatGameState(5))
+    scores = agent.scores
+
+    def recording(node, ref=-1):
+        if ref >= 0:
+            above, distance = node, 0
+            while above != ref:
+                above, distance = agent.tree.parent[above], distance + 1
+            distances.append(distance)
+        return scores(node, ref)
+
+    monkeypatch.setattr(agent, 'scores', recording)
+    simulate(agent)
+    assert any(distances)
+    assert all(distance % 2 == 0 for distance in distances)
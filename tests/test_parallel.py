@@ -0,0 +1,28 @@
+import random
+
+from agents.grave import GRaveMctsAgent
+from flat_state import FlatGameState
+from parallel import PipelinedSearch
+
+
+def test_pipelined_root_matches_backed_up_outcomes():
+    random.seed(0)
+    agent = GRaveMctsAgent(FlatGameState(7), node_budget=150)
+    batches = []
+    backup = agent.backup
+
+    def recording(node, player, outcome, rave_pts):
+        batches.append(outcome)
+        backup(node, player, outcome, rave_pts)
+
+    agent.backup = recording
+    pipeline = PipelinedSearch(agent, workers=2, in_flight=16, executor="thread")
+    try:
+        pipeline.search(1.5)
+    finally:
+        pipeline.close()
+
+    player = agent.root_state.turn()
+    assert batches
+    assert agent.root.N == sum(batch.playouts for batch in batches)
+    assert agent.root.Q == sum(batch.playouts - 2 * batch.wins[player] for batch in batches)
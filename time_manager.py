@@ -0,0 +1,62 @@
+from math import ceil
+from game import GameState
+
+class TimeManager:
+    """
+    Splits a total game clock over the moves. Each move gets a target time,
+    the remaining clock over the moves still expected for us (from the
+    empty cells, i.e. the branching factor) weighted by game phase, and a
+    hard maximum it may extend to. should_stop is the search's stop hook.
+
+    """
+    # share of the empty cells still expected to be played before a win
+    FILL_RATIO = 0.6
+    MIN_MOVES_LEFT = 5
+    # the middle game, in our moves, gets twice the time
+    MIDGAME = (9, 20)
+    MIDGAME_WEIGHT = 2
+    # how far past the target a close decision may run, capped by a share of the clock
+    MAX_EXTENSION = 2
+    MAX_SHARE = 0.25
+    # runner-up visits above this share of the leader's count as close
+    CLOSE_RATIO = 0.8
+    MIN_TIME = 0.05
+
+    def __init__(self, total: float):
+        self.total = total
+        self.remaining = total
+        self.target = 0
+        self.maximum = 0
+
+    def allocate(self, state: GameState) -> tuple:
+        """Target and maximum search time for the move to play in state."""
+        empty = len(state.moves())
+        moves_left = max(self.MIN_MOVES_LEFT, ceil(empty * self.FILL_RATIO / 2))
+        turn = sum(state.get_num_played().values()) // 2 + 1
+        phase = self.MIDGAME_WEIGHT if self.MIDGAME[0] <= turn < self.MIDGAME[1] else 1
+
+        cap = max(self.MIN_TIME, self.remaining * self.MAX_SHARE)
+        self.target = min(max(self.MIN_TIME, self.remaining * phase / moves_left), cap)
+        self.maximum = min(self.target * self.MAX_EXTENSION, cap)
+        return self.target, self.maximum
+
+    def should_stop(self, agent, elapsed: float, rollouts: int) -> bool:
+        """
+        Stop once the leading root child cannot be overtaken at the current
+        rollout rate before the maximum, and past the target unless the
+        two leading children are close.
+
+        """
+        if elapsed >= self.maximum:
+            return True
+
+        first, second = agent.leading_visits()
+        left = rollouts / elapsed * (self.maximum - elapsed) if elapsed > 0 else float('inf')
+        if first - second > left:
+            return True
+        if elapsed < self.target:
+            return False
+        return second < first * self.CLOSE_RATIO
+
+    def spend(self, elapsed: float) -> None:
+        self.remaining = max(0, self.remaining - elapsed)
@@ -0,0 +1,65 @@
+from collections import OrderedDict
+
+class TranspositionTable:
+    """
+    Bounded map from position hash to search node, evicting the least
+    recently used entry when full. Linking freshly expanded children to
+    stored nodes turns the tree into a DAG: every move order reaching a
+    position shares one node and its statistics. Evicting an entry only
+    stops new links to its node; the node itself stays in the tree.
+    MCTS.release() drops the entries a new root can no longer reach.
+
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lookups = 0
+        self.hits = 0
+        self.saved = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def link(self, parent, state, moves: list = None) -> int:
+        """
+        Replace the new children of parent, expanded in state, by the stored
+        nodes of the same positions and store the others. moves names the
+        new children when parent already had some, by default all are new.
+        Returns the number of links; saved counts the rollouts the linked
+        nodes bring along.
+
+        """
+        hits = self.hits
+        entries = self.entries
+        children = parent.children
+        for move in children if moves is None else moves:
+            child = children[move]
+            key = state.hash_after(move)
+            self.lookups += 1
+            node = entries.get(key)
+            if node is None:
+                entries[key] = child
+                if len(entries) > self.capacity:
+                    entries.popitem(last=False)
+            else:
+                entries.move_to_end(key)
+                children[move] = node
+                self.hits += 1
+                self.saved += node.N
+        return self.hits - hits
+
+    def retain(self, nodes: set) -> None:
+        """Drop the entries whose nodes are not in nodes, e.g. those a new root cannot reach."""
+        self.entries = OrderedDict((key, node) for key, node in self.entries.items() if node in nodes)
+
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0
+
+    def reset_statistics(self) -> None:
+        self.lookups = 0
+        self.hits = 0
+        self.saved = 0
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.reset_statistics()
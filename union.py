@@ -1,61 +1,97 @@
-class UnionFind:
-    def __init__(self) -> None:
-        self.parent = {}
-        self.rank = {}
+class ArrayUnionFind:
+    """
+    Union-find over the integer nodes 0 .. size - 1 (board cells followed by
+    the virtual edge nodes), kept in preallocated lists. Membership lists
+    are only maintained when track_groups is set. Every root carries the
+    OR of the bit flags of its group's nodes (see set_flags), merged on
+    join, so flags_of answers e.g. which edges a group touches in O(1).
+
+    """
+    def __init__(self, size: int, track_groups: bool = False) -> None:
+        self.size = size
+        self.parent = list(range(size))
+        self.rank = [0] * size
+        self.flags = [0] * size
+        self.marks = {}
+        self.track_groups = track_groups
         self.groups = {}
         self.ignored = []
 
-    def join(self, x, y) -> bool:
+    def join(self, x: int, y: int) -> bool:
         rep_x = self.find(x)
         rep_y = self.find(y)
 
         if rep_x == rep_y:
             return False
-        if self.rank[rep_x] < self.rank[rep_y]:
-            self.parent[rep_x] = rep_y
-
-            self.groups[rep_y].extend(self.groups[rep_x])
-            del self.groups[rep_x]
-        elif self.rank[rep_x] > self.rank[rep_y]:
-            self.parent[rep_y] = rep_x
-
-            self.groups[rep_x].extend(self.groups[rep_y])
-            del self.groups[rep_y]
-        else:
-            self.parent[rep_x] = rep_y
+        if self.rank[rep_x] > self.rank[rep_y]:
+            rep_x, rep_y = rep_y, rep_x
+        elif self.rank[rep_x] == self.rank[rep_y]:
             self.rank[rep_y] += 1
+        self.parent[rep_x] = rep_y
+        self.flags[rep_y] |= self.flags[rep_x]
 
-            self.groups[rep_y].extend(self.groups[rep_x])
-            del self.groups[rep_x]
+        if self.track_groups:
+            members = self.groups.pop(rep_x, None)
+            if members is None:
+                members = self._singleton(rep_x)
+            self.groups.setdefault(rep_y, self._singleton(rep_y)).extend(members)
 
         return True
 
-    def find(self, x):
-        if x not in self.parent:
-            self.parent[x] = x
-            self.rank[x] = 0
-            if x in self.ignored:
-                self.groups[x] = []
-            else:
-                self.groups[x] = [x]
-
-        px = self.parent[x]
-        if x == px:
-            return x
-
-        gx = self.parent[px]
-        if gx == px:
-            return px
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
 
-        self.parent[x] = gx
+    def connected(self, x: int, y: int) -> bool:
+        return self.find(x) == self.find(y)
 
-        return self.find(gx)
+    def flags_of(self, x: int) -> int:
+        return self.flags[self.find(x)]
 
-    def connected(self, x, y) -> bool:
-        return self.find(x) == self.find(y)
+    def set_flags(self, marks: dict) -> None:
+        """Bit flags of single nodes, kept across reset()."""
+        self.marks = dict(marks)
+        for x, flag in marks.items():
+            self.flags[x] = flag
 
     def set_ignored_elements(self, ignore):
         self.ignored = ignore
 
     def get_groups(self) -> dict:
         return self.groups
+
+    def reset(self) -> None:
+        self.parent[:] = range(self.size)
+        self.rank[:] = [0] * self.size
+        self.flags[:] = [0] * self.size
+        for x, flag in self.marks.items():
+            self.flags[x] = flag
+        self.groups.clear()
+
+    def copy_from(self, other: 'ArrayUnionFind') -> None:
+        self.parent[:] = other.parent
+        self.rank[:] = other.rank
+        self.flags[:] = other.flags
+        if self.track_groups:
+            self.groups = {rep: members[:] for rep, members in other.groups.items()}
+
+    def clone(self) -> 'ArrayUnionFind':
+        clone = ArrayUnionFind.__new__(ArrayUnionFind)
+        clone.size = self.size
+        clone.parent = self.parent[:]
+        clone.rank = self.rank[:]
+        clone.flags = self.flags[:]
+        clone.marks = self.marks
+        clone.track_groups = self.track_groups
+        clone.groups = {rep: members[:] for rep, members in self.groups.items()}
+        clone.ignored = self.ignored
+        return clone
+
+    def __deepcopy__(self, memo):
+        return self.clone()
+
+    def _singleton(self, x: int) -> list:
+        return [] if x in self.ignored else [x]